@@ -12,7 +12,14 @@ celery_app = Celery(
 # Route image tasks to a specific queue
 celery_app.conf.task_routes = {
     "app.tasks.image_tasks.submit_image_task": {"queue": "image_queue"},
-    "app.tasks.image_tasks.poll_all_processing_images": {"queue": "polling_queue"},
+    "app.tasks.image_tasks.generate_derivatives_task": {"queue": "image_queue"},
+    "app.tasks.image_tasks.backfill_derivatives": {"queue": "image_queue"},
+    "app.tasks.image_tasks.poll_due_images": {"queue": "polling_queue"},
+    "app.tasks.image_tasks.reschedule_orphaned_polls": {"queue": "polling_queue"},
+    "app.tasks.image_tasks.handle_task_callback": {"queue": "polling_queue"},
+    "app.tasks.image_tasks.dispatch_fair_queue": {"queue": "polling_queue"},
+    "app.tasks.image_tasks.release_upload_reservations": {"queue": "polling_queue"},
+    "app.tasks.image_tasks.reconcile_status_counts": {"queue": "polling_queue"},
 }
 
 # Optional: enable UTC & serializer settings
@@ -22,6 +29,12 @@ celery_app.conf.update(
     accept_content=['json'],
     timezone='UTC',
     enable_utc=True,
+    # Redis hands an unacknowledged task to another worker after visibility_timeout, and
+    # countdown tasks stay unacknowledged until due. Keep it above the longest countdown
+    # (release_upload_reservations, UPLOAD_RESERVATION_TTL) so they are not run twice.
+    broker_transport_options={
+        "visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(4 * 60 * 60))),
+    },
 )
 
 logger.info("✅ Celery app initialized.")
@@ -0,0 +1,21 @@
+# app/config/operations.py
+
+# MakeIt3D endpoint and fixed request params per operation.
+# The params are part of the result cache key, so changing them invalidates cached outputs.
+OPERATIONS = {
+    "remove-bg": {
+        "endpoint": "/generate/remove-background",
+        "params": {"provider": "stability", "output_format": "png"},
+    },
+    "upscale": {
+        "endpoint": "/generate/upscale",
+        "params": {"provider": "stability", "output_format": "png", "model": "fast", "prompt": "high quality detailed image"},
+    },
+    "downscale": {
+        "endpoint": "/generate/downscale",
+        "params": {"max_size_mb": 2.0, "aspect_ratio_mode": "original", "output_format": "jpeg"},
+    },
+}
+
+# Chained jobs ("remove-bg then upscale") run at most this many operations
+MAX_PIPELINE_STAGES = 3
@@ -1,8 +1,12 @@
 # app/config/plans.py
 
+# weight: share of the image queue a shop on this plan gets while others are busy
 PLANS = {
-    "100":  {"credits": 100,  "price": 10},
-    "500":  {"credits": 500,  "price": 45},
-    "1000": {"credits": 1000, "price": 75},
-    "5000": {"credits": 5000, "price": 300},
+    "100":  {"credits": 100,  "price": 10,  "weight": 1},
+    "500":  {"credits": 500,  "price": 45,  "weight": 2},
+    "1000": {"credits": 1000, "price": 75,  "weight": 3},
+    "5000": {"credits": 5000, "price": 300, "weight": 4},
 }
+
+# Shops without a paid plan ("free") or with an unknown one
+DEFAULT_PLAN_WEIGHT = 1
@@ -12,12 +12,16 @@ from app.routers.upload_router import upload_router
 from app.routers.image_router import image_router
 from app.routers.me_router import me_router
 from app.routers.webhooks_router import webhook_router
+from app.routers.makeit3d_webhooks_router import makeit3d_webhook_router
 from app.routers.fileserve_router import fileserve_router
 from app.routers.settings_router import settings_router
 from app.routers.credits_router import credits_router
 from app.routers.dashboard_stats_router import dashboard_stats_router
 from app.middleware.rate_limiter import RateLimitMiddleware
 from app.middleware.csp_middleware import CSPMiddleware
+from app.middleware.body_limit import BodySizeLimitMiddleware
+from app.services.async_supabase import get_db, close_db
+from app.services.status_events import status_hub
 from app.logging_config import logger
 
 import os
@@ -41,6 +45,16 @@ def create_app():
     async def health_check():
         return {"status": "ok"}
 
+    # One async Supabase client (and connection pool) per worker process
+    @app.on_event("startup")
+    async def open_db_pool():
+        await get_db()
+
+    @app.on_event("shutdown")
+    async def close_db_pool():
+        await status_hub.close()
+        await close_db()
+
     # --- Core middleware (order matters) ---
     app.add_middleware(
         CORSMiddleware,
@@ -69,7 +83,8 @@ def create_app():
         },
         # allow specific shops to bypass limits (CSV env)
         allowlist_shops=set(filter(None, (os.getenv("RL_ALLOWLIST", "").split(",")))),
-        exempt_paths={"/health", "/metrics", "/docs", "/openapi.json", "/favicon.ico"},
+        # provider callbacks arrive in bursts from a few IPs; they are signature-checked instead
+        exempt_paths={"/health", "/metrics", "/docs", "/openapi.json", "/favicon.ico", "/webhooks/makeit3d"},
         exempt_methods={"OPTIONS"},
         jwt_secret=os.getenv("JWT_SECRET", "change_me"),
         # set this if you have a stable user/account id header; otherwise it falls back to shop/ip
@@ -77,6 +92,18 @@ def create_app():
         header_prefix="RateLimit",  # emits RateLimit-Limit/Remaining/Reset
     )
 
+    # Refuse oversized bodies before they are read or spooled (outermost of the three)
+    max_upload_bytes = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+    app.add_middleware(
+        BodySizeLimitMiddleware,
+        max_body_size=int(os.getenv("MAX_BODY_BYTES", str(1024 * 1024))),
+        per_path_limits={
+            "/upload": max_upload_bytes + 64 * 1024,  # one file + multipart overhead
+            "/settings/avatar": max_upload_bytes + 64 * 1024,
+            "/upload/batch": int(os.getenv("MAX_BATCH_BODY_BYTES", str(500 * 1024 * 1024))),
+        },
+    )
+
     # Security headers (keep after above)
     @app.middleware("http")
     async def security_headers(request: Request, call_next):
@@ -109,10 +136,12 @@ def create_app():
     register_metrics(app)
     app.include_router(health_router)
     app.include_router(auth_router)
-    app.include_router(upload_router)
+    # Before upload_router: its /images/{image_id} would otherwise capture /images/events
     app.include_router(image_router)
+    app.include_router(upload_router)
     app.include_router(me_router)
     app.include_router(webhook_router)
+    app.include_router(makeit3d_webhook_router)
     app.include_router(fileserve_router)
     app.include_router(settings_router)
     app.include_router(credits_router)
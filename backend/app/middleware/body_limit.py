@@ -0,0 +1,98 @@
+import json
+import logging
+from typing import Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger("body_limit")
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies over a size limit before the app buffers them.
+
+    Plain ASGI rather than BaseHTTPMiddleware, because the limit has to sit on `receive`:
+    - a declared Content-Length over the limit is refused before a single body byte is read
+    - bodies without one (chunked) are counted as they arrive and cut off at the limit
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_body_size: int,
+        per_path_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.per_path_limits = per_path_limits or {}
+
+    def _limit_for_path(self, path: str) -> int:
+        # exact match, like the rate limiter
+        return self.per_path_limits.get(path, self.max_body_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit_for_path(scope["path"])
+        headers = dict(scope.get("headers") or [])
+        declared = headers.get(b"content-length")
+        if declared is not None:
+            try:
+                if int(declared) > limit:
+                    await self._reject(send, limit)
+                    return
+            except ValueError:
+                await self._reject(send, limit, status=400, message="Invalid Content-Length")
+                return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise BodyTooLarge()
+            return message
+
+        async def guarded_send(message: Message):
+            nonlocal response_started
+            # Whatever the app answers after the cut-off (usually a form-parsing 400) is replaced by a 413
+            if exceeded and not response_started:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+
+        if exceeded and not response_started:
+            await self._reject(send, limit)
+
+    async def _reject(self, send: Send, limit: int, status: int = 413, message: Optional[str] = None):
+        logger.warning(f"🚫 Request body rejected ({status}), limit {limit} bytes")
+        body = json.dumps({"error": message or f"Request body exceeds {limit} bytes"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import RedirectResponse
-from supabase import create_client
+from app.services.async_supabase import get_db
 from app.services.shopify_webhooks import register_shopify_webhooks
 from app.services.supabase_service import initialize_shop_credits
-import os, httpx, jwt, time, urllib.parse
+import os, httpx, jwt, time, urllib.parse, asyncio
 
 # ──────────────────────🔐 Environment Variables ──────────────────────
 SHOPIFY_API_KEY = os.getenv("SHOPIFY_API_KEY")
@@ -20,7 +20,6 @@ if not all([SHOPIFY_API_KEY, SHOPIFY_API_SECRET, SUPABASE_URL, SUPABASE_SERVICE_
 
 # ──────────────────────📦 Setup ──────────────────────
 REDIRECT_URI = f"{BACKEND_URL}/auth/callback"
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 auth_router = APIRouter()
 
 
@@ -131,15 +130,16 @@ async def auth_callback(request: Request):
             raise HTTPException(status_code=500, detail="Access token not received")
 
         # 💾 Save to Supabase
-        supabase.table("shops").upsert({
+        db = await get_db()
+        await db.table("shops").upsert({
             "shop": shop,
             "access_token": access_token,
         }, on_conflict=["shop"]).execute()
 
-        initialize_shop_credits(shop, initial_credits=10)
+        await asyncio.to_thread(initialize_shop_credits, shop, initial_credits=10)
         # after saving shop_domain & access_token to Supabase:
         try:
-            register_shopify_webhooks(shop, access_token)
+            await asyncio.to_thread(register_shopify_webhooks, shop, access_token)
         except Exception as e:
             # log but don't block merchant install
             print("Webhook registration failed:", e)
@@ -1,11 +1,11 @@
 # routers/credits_router.py
 from fastapi import APIRouter, Request, HTTPException, Cookie
 from fastapi.responses import RedirectResponse, JSONResponse
-from app.services.supabase_service import supabase
+from app.services.async_supabase import get_db
 from app.services.shopify_admin import shopify_graphql
 from app.services.credits_service import add_credits_and_record, now_iso
 from app.config.plans import PLANS
-import os, jwt, time
+import os, jwt, time, asyncio
 
 credits_router = APIRouter(prefix="")
 
@@ -34,8 +34,9 @@ def get_shop_from_session(session: str):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid session")
 
-def get_access_token(shop: str) -> str:
-    res = supabase.table("shops").select("access_token").eq("shop", shop).maybe_single().execute()
+async def get_access_token(shop: str) -> str:
+    db = await get_db()
+    res = await db.table("shops").select("access_token").eq("shop", shop).maybe_single().execute()
     shop_data = getattr(res, "data", None)
     if not shop_data or not shop_data.get("access_token"):
         raise HTTPException(status_code=401, detail="Missing Shopify access token")
@@ -57,7 +58,8 @@ async def create_checkout(request: Request, session: str = Cookie(None)):
         confirmation_url = f"{APP_URL}/credits/confirm?planId={plan_id}&sandbox=true&purchaseId={purchase_id}"
 
         # Insert pending record
-        supabase.table("credit_pending").insert({
+        db = await get_db()
+        await db.table("credit_pending").insert({
             "shop_domain": shop,
             "plan_id": plan_id,
             "purchase_id": purchase_id,
@@ -69,7 +71,7 @@ async def create_checkout(request: Request, session: str = Cookie(None)):
         return JSONResponse({"confirmationUrl": confirmation_url})
 
     # Real Shopify billing
-    access_token = get_access_token(shop)
+    access_token = await get_access_token(shop)
     return_url = f"{APP_URL}/credits/confirm?planId={plan_id}"
 
     mutation = """
@@ -88,7 +90,8 @@ async def create_checkout(request: Request, session: str = Cookie(None)):
         "returnUrl": return_url
     }
 
-    data = shopify_graphql(shop, access_token, mutation, variables)
+    # Shopify Admin client is blocking; keep it off the event loop
+    data = await asyncio.to_thread(shopify_graphql, shop, access_token, mutation, variables)
     payload = data.get("appPurchaseOneTimeCreate", {})
     if payload.get("userErrors"):
         raise HTTPException(status_code=400, detail=str(payload["userErrors"]))
@@ -99,7 +102,8 @@ async def create_checkout(request: Request, session: str = Cookie(None)):
         raise HTTPException(status_code=500, detail="Failed to generate Shopify confirmation URL")
 
     # Insert pending record
-    supabase.table("credit_pending").insert({
+    db = await get_db()
+    await db.table("credit_pending").insert({
         "shop_domain": shop,
         "plan_id": plan_id,
         "purchase_id": purchase_id,
@@ -123,12 +127,12 @@ async def confirm_after_return(planId: str, session: str = Cookie(None), sandbox
     if SANDBOX_MODE or sandbox:
         if not purchaseId:
             raise HTTPException(status_code=400, detail="Missing sandbox purchaseId")
-        new_balance = add_credits_and_record(shop, plan["credits"], plan_id, "sandbox", purchaseId)
+        new_balance = await asyncio.to_thread(add_credits_and_record, shop, plan["credits"], plan_id, "sandbox", purchaseId)
         print(f"[sandbox] {shop} credits updated: {new_balance}")
         return RedirectResponse(f"{FRONTEND_URL}/dashboard?credits_added={plan['credits']}")
 
     # Real Shopify billing verification
-    access_token = get_access_token(shop)
+    access_token = await get_access_token(shop)
     query = """
     query {
       currentAppInstallation {
@@ -138,7 +142,7 @@ async def confirm_after_return(planId: str, session: str = Cookie(None), sandbox
       }
     }
     """
-    data = shopify_graphql(shop, access_token, query)
+    data = await asyncio.to_thread(shopify_graphql, shop, access_token, query)
     purchases = [edge["node"] for edge in data.get("currentAppInstallation", {}).get("oneTimePurchases", {}).get("edges", [])]
 
     target_name = f"Maxflow Credits {plan['credits']}"
@@ -147,7 +151,8 @@ async def confirm_after_return(planId: str, session: str = Cookie(None), sandbox
     if not active:
         return RedirectResponse(f"{FRONTEND_URL}/payment-pending")
 
-    add_credits_and_record(
+    await asyncio.to_thread(
+        add_credits_and_record,
         shop,
         plan["credits"],
         plan_id,
@@ -169,7 +174,8 @@ async def get_credits(request: Request, session: str = Cookie(None)):
     if not shop_domain:
         raise HTTPException(status_code=401, detail="Invalid session")
 
-    result = supabase.table("shop_credits").select("credits").eq("shop_domain", shop_domain).single().execute()
+    db = await get_db()
+    result = await db.table("shop_credits").select("credits").eq("shop_domain", shop_domain).single().execute()
 
     # ✅ Default value agar record nahi mila
     credits = result.data["credits"] if result.data else 0
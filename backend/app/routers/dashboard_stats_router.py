@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Request, HTTPException, Cookie
-from app.services.supabase_service import supabase
-from app.services.signed_url_util import get_signed_url
+from app.services.async_supabase import get_db
+from app.services.signed_url_util import get_signed_urls_async
+from app.services.derivatives import display_path
 import jwt
 import os
 import logging
@@ -24,24 +25,24 @@ async def get_dashboard_stats(request: Request, session: str = Cookie(None)):
         raise HTTPException(status_code=401, detail="Invalid session")
 
     try:
-        # Get all images for stats
-        images_res = (
-            supabase.table("images")
-            .select("*")
+        # Counts per status, maintained by a trigger on images (a few rows, whatever the history)
+        db = await get_db()
+        counts_res = await (
+            db.table("image_status_counts")
+            .select("status, count")
             .eq("shop", shop)
-            .order("created_at", desc=True)
             .execute()
         )
-        images = images_res.data or []
+        counts = {row["status"]: row["count"] for row in counts_res.data or []}
 
-        total = len(images)
-        processing = sum(1 for img in images if img["status"] == "processing")
-        failed = sum(1 for img in images if img["status"] in ["error", "failed"])
-        completed = sum(1 for img in images if img["status"] == "processed")
+        total = sum(counts.values())
+        processing = counts.get("processing", 0)
+        failed = counts.get("error", 0) + counts.get("failed", 0)
+        completed = counts.get("processed", 0)
 
         # Fetch recent processed images only
-        recent_res = (
-            supabase.table("images")
+        recent_res = await (
+            db.table("images")
             .select("*")
             .eq("shop", shop)
             .eq("status", "processed")
@@ -51,22 +52,21 @@ async def get_dashboard_stats(request: Request, session: str = Cookie(None)):
         )
         recent_images = recent_res.data or []
 
+        # Sign all recent thumbnails in one bulk call
+        urls = await get_signed_urls_async(display_path(img) for img in recent_images)
+
         recent = []
         for img in recent_images:
-            try:
-                processed_path = img.get("processed_path")
-                if not processed_path:
-                    continue
-
-                signed_url = get_signed_url(processed_path)
+            signed_url = urls.get(display_path(img))
+            if not signed_url:
+                logger.warning(f"Could not create signed URL for image {img.get('id')}")
+                continue
 
-                recent.append({
-                    "url": signed_url,
-                    "operation": img.get("operation", "Imported Image"),
-                    "status": format_status(img["status"])
-                })
-            except Exception as e:
-                logger.warning(f"Could not create signed URL for image {img.get('id')}: {e}")
+            recent.append({
+                "url": signed_url,
+                "operation": img.get("operation", "Imported Image"),
+                "status": format_status(img["status"])
+            })
 
         return {
             "stats": {
@@ -1,13 +1,29 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from app.services.supabase_service import supabase
-from app.services.signed_url_util import get_signed_url  
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, FileResponse, Response
+from app.services.signed_url_util import get_signed_url, get_signed_url_async
+from app.services.async_supabase import get_http
+from app.services import download_cache
+from app.services.download_cache import DOWNLOAD_CACHE_ENABLED, download_cache_lookups
+import asyncio
+import anyio
 import httpx
 import logging
+import os
 
 fileserve_router = APIRouter()
 logger = logging.getLogger("fileserve_router")
 
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+# Read timeout applies per chunk, so large files are not cut off, only stalled ones
+DOWNLOAD_TIMEOUT = httpx.Timeout(10, read=float(os.getenv("DOWNLOAD_READ_TIMEOUT", "60")))
+
+# Forwarded to storage so partial, resumed and conditional downloads work end to end
+PROXY_REQUEST_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+PROXY_RESPONSE_HEADERS = (
+    "content-type", "content-length", "content-range", "accept-ranges",
+    "etag", "last-modified", "cache-control",
+)
+
 
 @fileserve_router.get("/fileserve/signed-url/{path:path}")
 def generate_signed_url(path: str):
@@ -19,28 +35,105 @@ def generate_signed_url(path: str):
         raise HTTPException(status_code=500, detail="Failed to generate signed URL")
 
 
-@fileserve_router.get("/fileserve/download")
-async def download_image(path: str = Query(...)):
-    try:
-        signed_url = get_signed_url(path)
+def serve_cached(request: Request, entry: dict, disposition: str) -> Response:
+    """A disk cache hit, sent by FileResponse (which also answers Range/If-Range requests)."""
+    headers = {"ETag": entry["etag"], "Content-Disposition": disposition}
+    if entry["etag"] in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(entry["file"], media_type=entry["content_type"], headers=headers)
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(signed_url)
 
-        if resp.status_code != 200:
-            logger.warning(f"Supabase file fetch failed: {resp.status_code}")
-            raise HTTPException(status_code=404, detail="Image not found")
+@fileserve_router.get("/fileserve/download")
+async def download_image(request: Request, path: str = Query(...)):
+    """
+    Relay a stored file as an attachment, chunk by chunk over the shared connection pool.
+    Nothing is buffered: a slow client slows the read from storage instead of filling
+    memory. Range/If-Range and the validators are passed through, so 206 and 304 work.
 
-        filename = path.split("/")[-1]
-        return StreamingResponse(
-            iter([resp.content]),
-            media_type=resp.headers.get("content-type", "application/octet-stream"),
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"'
-            }
-        )
+    Full downloads are kept in the local disk cache on the way through; later downloads
+    of the same object are served from disk while storage confirms its ETag.
+    """
+    filename = path.split("/")[-1]
+    disposition = f'attachment; filename="{filename}"'
+
+    cached = await asyncio.to_thread(download_cache.lookup, path) if DOWNLOAD_CACHE_ENABLED else None
+    if cached and download_cache.is_fresh(cached):
+        download_cache_lookups.labels("hit").inc()
+        return serve_cached(request, cached, disposition)
 
+    try:
+        signed_url = await get_signed_url_async(path)
     except Exception as e:
         logger.warning(f"Download failed: {e}")
         raise HTTPException(status_code=500, detail=f"Download error: {str(e)}")
 
+    # identity, so Content-Length and byte ranges refer to the stored bytes
+    upstream_headers = {"accept-encoding": "identity"}
+    if cached:
+        # Revalidate our copy; the client's own Range/conditionals are answered from disk
+        upstream_headers["if-none-match"] = cached["etag"]
+    else:
+        for name in PROXY_REQUEST_HEADERS:
+            if name in request.headers:
+                upstream_headers[name] = request.headers[name]
+
+    http = await get_http()
+    try:
+        resp = await http.send(
+            http.build_request("GET", signed_url, headers=upstream_headers, timeout=DOWNLOAD_TIMEOUT),
+            stream=True,
+        )
+    except httpx.HTTPError as e:
+        logger.warning(f"Download failed: {e}")
+        raise HTTPException(status_code=502, detail="Storage unavailable")
+
+    if cached and resp.status_code == 304:
+        await resp.aclose()
+        download_cache_lookups.labels("revalidated").inc()
+        await asyncio.to_thread(download_cache.mark_validated, path, cached)
+        return serve_cached(request, cached, disposition)
+
+    if resp.status_code not in (200, 206, 304, 416):
+        await resp.aclose()
+        logger.warning(f"Supabase file fetch failed: {resp.status_code}")
+        if resp.status_code in (400, 404):
+            if cached:
+                await asyncio.to_thread(download_cache.invalidate, path)
+            raise HTTPException(status_code=404, detail="Image not found")
+        raise HTTPException(status_code=502, detail="Storage unavailable")
+
+    headers = {name: resp.headers[name] for name in PROXY_RESPONSE_HEADERS if name in resp.headers}
+    headers["Content-Disposition"] = disposition
+
+    writer = None
+    if DOWNLOAD_CACHE_ENABLED:
+        download_cache_lookups.labels("miss").inc()
+        if resp.status_code == 200:
+            length = resp.headers.get("content-length")
+            writer = await asyncio.to_thread(
+                download_cache.open_writer,
+                path,
+                resp.headers.get("etag"),
+                resp.headers.get("content-type", "application/octet-stream"),
+                int(length) if length and length.isdigit() else None,
+            )
+
+    async def relay():
+        cache = writer
+        try:
+            async for chunk in resp.aiter_raw(DOWNLOAD_CHUNK_SIZE):
+                if cache and not await asyncio.to_thread(cache.write, chunk):
+                    cache = None
+                yield chunk
+            if cache:
+                await asyncio.to_thread(cache.commit)
+                cache = None
+        finally:
+            # Client went away or storage failed mid-transfer: keep nothing, and give the
+            # connection back to the pool even though the request was cancelled
+            if cache:
+                cache.abort()
+            with anyio.CancelScope(shield=True):
+                await resp.aclose()
+
+    return StreamingResponse(relay(), status_code=resp.status_code, headers=headers)
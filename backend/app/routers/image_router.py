@@ -1,5 +1,16 @@
-from fastapi import APIRouter, Request, HTTPException, Cookie
-from app.services.supabase_service import supabase
+from fastapi import APIRouter, Request, HTTPException, Cookie, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from app.services.async_supabase import get_db
+from app.services.status_events import status_hub
+from app.services.signed_url_util import get_signed_urls_async, SIGNED_URL_CACHE_MAX_TTL
+from app.services.derivatives import display_path
+from app.config.operations import OPERATIONS
+from typing import Optional
+from datetime import datetime
+import hashlib
+import base64
+import json
+import time
 import uuid
 import logging
 import jwt
@@ -10,6 +21,26 @@ logger = logging.getLogger("image_router")
 
 JWT_SECRET = os.getenv("JWT_SECRET")
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET")
+IMAGES_PAGE_SIZE = int(os.getenv("IMAGES_PAGE_SIZE", "50"))
+IMAGES_MAX_PAGE_SIZE = int(os.getenv("IMAGES_MAX_PAGE_SIZE", "200"))
+
+# What list views use; the full row stays available from /status/{image_id}
+IMAGE_LIST_COLUMNS = (
+    "id, filename, status, operation, pipeline, error_message, "
+    "original_path, processed_path, thumbnail_path, preview_path, created_at"
+)
+# Bulk status lookups: ids per request (kept so the in_ filter fits in one PostgREST URL)
+# and the columns a progress view needs
+STATUS_BATCH_MAX_IDS = int(os.getenv("STATUS_BATCH_MAX_IDS", "300"))
+STATUS_BATCH_COLUMNS = "id, status, error_message, processed_path"
+IMAGE_STATUSES = ("pending", "queued", "processing", "processed", "completed", "failed", "error", "awaiting_upload")
+
+# Live status stream: what a client gets on (re)connect, then status events as workers publish them
+IMAGE_EVENT_COLUMNS = "id, filename, status, operation, error_message, original_path, processed_path, created_at"
+ACTIVE_STATUSES = ("pending", "queued", "processing")
+STATUS_SNAPSHOT_LIMIT = int(os.getenv("STATUS_SNAPSHOT_LIMIT", "500"))
+STATUS_HEARTBEAT_SECONDS = float(os.getenv("STATUS_HEARTBEAT_SECONDS", "15"))
+STATUS_RETRY_MS = int(os.getenv("STATUS_RETRY_MS", "2000"))
 
 def validate_uuid(id_str: str) -> str | None:
     try:
@@ -17,6 +48,22 @@ def validate_uuid(id_str: str) -> str | None:
     except Exception:
         return None
 
+def get_shop_from_session(session: Optional[str]) -> str:
+    if not session:
+        raise HTTPException(status_code=401, detail="Missing session")
+
+    try:
+        payload = jwt.decode(session, JWT_SECRET, algorithms=["HS256"])
+        shop = payload.get("shop")
+        if not shop:
+            raise Exception("Shop not found in session")
+        return shop
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Session expired")
+    except Exception as e:
+        logger.warning(f"Session decode failed: {e}")
+        raise HTTPException(status_code=401, detail="Invalid session")
+
 @image_router.get("/status/{image_id}")
 async def get_image_status(image_id: str):
     """
@@ -27,8 +74,9 @@ async def get_image_status(image_id: str):
         raise HTTPException(status_code=400, detail="Invalid UUID")
 
     try:
-        result = (
-            supabase
+        db = await get_db()
+        result = await (
+            db
             .table("images")
             .select("*")
             .eq("id", valid_id)
@@ -51,35 +99,221 @@ async def get_image_status(image_id: str):
         logger.error(f"Error fetching image status: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch image status")
 
+@image_router.post("/status/batch")
+async def get_image_statuses(request: Request, session: str = Cookie(None)):
+    """
+    Status of many images in one call, for progress screens that would otherwise poll
+    /status/{image_id} per image. Body: {"image_ids": [...]}, at most STATUS_BATCH_MAX_IDS.
+    Returns {"images": {id: {"status", "error"?, "processed_path"?}}, "not_found": [...]};
+    ids of other shops count as not found.
+    """
+    shop = get_shop_from_session(session)
+
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    image_ids = body.get("image_ids") if isinstance(body, dict) else None
+    if not isinstance(image_ids, list) or not image_ids:
+        raise HTTPException(status_code=400, detail="image_ids is required")
+    if len(image_ids) > STATUS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {STATUS_BATCH_MAX_IDS} image_ids per request")
+
+    valid_ids = [validate_uuid(i) if isinstance(i, str) else None for i in image_ids]
+    invalid = [i for i, valid in zip(image_ids, valid_ids) if not valid]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"{len(invalid)} invalid UUID(s), e.g. {str(invalid[0])[:64]}")
+    valid_ids = list(dict.fromkeys(valid_ids))
+
+    try:
+        db = await get_db()
+        result = await (
+            db.table("images")
+            .select(STATUS_BATCH_COLUMNS)
+            .in_("id", valid_ids)
+            .eq("shop", shop)
+            .execute()
+        )
+    except Exception as e:
+        logger.error(f"Error fetching image statuses: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch image statuses")
+
+    images = {}
+    for row in result.data or []:
+        entry = {"status": row["status"]}
+        if row.get("error_message"):
+            entry["error"] = row["error_message"]
+        if row.get("processed_path"):
+            entry["processed_path"] = row["processed_path"]
+        images[row["id"]] = entry
+
+    return {
+        "success": True,
+        "images": images,
+        "not_found": [i for i in valid_ids if i not in images],
+    }
+
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """(created_at, id) from a cursor; both are re-serialized, since they end up inside a filter string."""
+    try:
+        created_at, image_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(image_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def list_etag(shop: str, version: int, *params) -> str:
+    """
+    Changes whenever any of the shop's images changes (version is bumped by a trigger) or the
+    request differs. The signing epoch rolls it at least daily, so a revalidated page never
+    keeps signed URLs past their cache window.
+    """
+    epoch = int(time.time() // SIGNED_URL_CACHE_MAX_TTL)
+    digest = hashlib.sha1(json.dumps([shop, version, epoch, *params]).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
 @image_router.get("/images")
-async def get_images_by_shop(session: str = Cookie(None)):
+async def get_images_by_shop(
+    request: Request,
+    session: str = Cookie(None),
+    variant: str = Query("thumbnail", pattern="^(thumbnail|preview|full|none)$"),
+    limit: int = Query(IMAGES_PAGE_SIZE, ge=1, le=IMAGES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    status: Optional[str] = Query(None, description="Comma-separated statuses, e.g. queued,processing"),
+    operation: Optional[str] = Query(None),
+):
     """
-    Fetch all images belonging to the authenticated shop.
+    One page of the authenticated shop's images, newest first. Pass `next_cursor` back as
+    `cursor` for the next page. Processed images carry a signed `display_url` for the
+    requested variant (thumbnail by default; `none` skips signing).
+
+    Responses carry an ETag; a matching If-None-Match gets a 304 after reading only the
+    shop's list version, without touching image rows.
     """
-    if not session:
-        raise HTTPException(status_code=401, detail="Missing session")
+    shop = get_shop_from_session(session)
+
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else []
+    if any(s not in IMAGE_STATUSES for s in statuses):
+        raise HTTPException(status_code=400, detail=f"status must be among {', '.join(IMAGE_STATUSES)}")
+    if operation and operation not in OPERATIONS:
+        raise HTTPException(status_code=400, detail="Invalid operation")
+    after = decode_cursor(cursor) if cursor else None
 
     try:
-        payload = jwt.decode(session, JWT_SECRET, algorithms=["HS256"])
-        shop = payload.get("shop")
-        if not shop:
-            raise Exception("Shop not found in session")
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Session expired")
+        db = await get_db()
+        version_res = await db.table("image_list_versions").select("version").eq("shop", shop).limit(1).execute()
+        version = version_res.data[0]["version"] if version_res.data else 0
     except Exception as e:
-        logger.warning(f"Session decode failed: {e}")
-        raise HTTPException(status_code=401, detail="Invalid session")
+        logger.error(f"Failed to read image list version for {shop}: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching images")
+
+    etag = list_etag(shop, version, variant, limit, cursor, sorted(statuses), operation)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=cache_headers)
 
     try:
-        result = (
-            supabase
-            .table("images")
-            .select("*")
-            .eq("shop", shop)
+        # Served by the (shop[, status|operation], created_at desc, id desc) indexes
+        query = db.table("images").select(IMAGE_LIST_COLUMNS).eq("shop", shop)
+        if len(statuses) == 1:
+            query = query.eq("status", statuses[0])
+        elif statuses:
+            query = query.in_("status", statuses)
+        if operation:
+            query = query.eq("operation", operation)
+        if after:
+            created_at, image_id = after
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{image_id})')
+        result = await (
+            query
             .order("created_at", desc=True)
+            .order("id", desc=True)
+            .limit(limit + 1)
             .execute()
         )
-        return {"images": result.data}
+        images = result.data or []
     except Exception as e:
         logger.error(f"Failed to fetch images for shop {shop}: {e}")
         raise HTTPException(status_code=500, detail="Error fetching images")
+
+    next_cursor = None
+    if len(images) > limit:
+        images = images[:limit]
+        next_cursor = encode_cursor(images[-1])
+
+    if variant != "none":
+        # One bulk signing call for the whole page instead of a round trip per row
+        paths = {img["id"]: display_path(img, variant) if img.get("status") == "processed" else None for img in images}
+        urls = await get_signed_urls_async(paths.values())
+        for img in images:
+            img["display_url"] = urls.get(paths[img["id"]]) if paths[img["id"]] else None
+
+    return JSONResponse({"images": images, "next_cursor": next_cursor}, headers=cache_headers)
+
+
+def sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@image_router.get("/images/events")
+async def stream_image_events(session: str = Cookie(None)):
+    """
+    Server-sent events for the authenticated shop's image statuses. Every connection
+    starts with a `snapshot` of the shop's in-flight images, then gets one `status` event
+    per transition (queued, processing, processed, failed) as the workers make it.
+    The stream ends when the client falls behind; EventSource reconnects and resyncs
+    from a fresh snapshot.
+    """
+    shop = get_shop_from_session(session)
+
+    # Subscribe before reading the snapshot, so no transition falls in between
+    try:
+        stream = await status_hub.subscribe(shop)
+    except Exception as e:
+        logger.error(f"Status events unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Live status unavailable")
+
+    try:
+        db = await get_db()
+        result = await (
+            db.table("images")
+            .select(IMAGE_EVENT_COLUMNS)
+            .eq("shop", shop)
+            .in_("status", list(ACTIVE_STATUSES))
+            .order("created_at", desc=True)
+            .limit(STATUS_SNAPSHOT_LIMIT)
+            .execute()
+        )
+        snapshot = result.data or []
+    except Exception as e:
+        status_hub.unsubscribe(stream)
+        logger.error(f"Failed to read status snapshot for {shop}: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching images")
+
+    async def events():
+        try:
+            yield f"retry: {STATUS_RETRY_MS}\n\n"
+            yield sse("snapshot", json.dumps({"images": snapshot}))
+            while True:
+                data = await stream.next(STATUS_HEARTBEAT_SECONDS)
+                if stream.overflowed:
+                    yield sse("resync", "{}")
+                    return
+                # Comment line keeps proxies from closing an idle stream
+                yield sse("status", data) if data else ": ping\n\n"
+        finally:
+            status_hub.unsubscribe(stream)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,87 @@
+from fastapi import APIRouter, Request, HTTPException, Header
+from app.services.redis_service import redis_client
+from app.tasks.image_tasks import handle_task_callback
+from app.logging_config import logger
+import asyncio
+import hmac
+import hashlib
+import json
+import os
+import time
+
+makeit3d_webhook_router = APIRouter()
+
+MAKEIT3D_WEBHOOK_SECRET = os.getenv("MAKEIT3D_WEBHOOK_SECRET")
+# Reject callbacks signed too long ago (replay protection)
+MAKEIT3D_WEBHOOK_TOLERANCE = int(os.getenv("MAKEIT3D_WEBHOOK_TOLERANCE", "300"))
+CALLBACK_DEDUPE_TTL = 60 * 60 * 24
+
+
+def sign_makeit3d_payload(body: bytes, timestamp: str) -> str:
+    """HMAC-SHA256 over "<timestamp>.<raw body>", hex encoded."""
+    message = timestamp.encode("utf-8") + b"." + body
+    return hmac.new(MAKEIT3D_WEBHOOK_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def verify_makeit3d_signature(body: bytes, signature: str, timestamp: str) -> bool:
+    if not MAKEIT3D_WEBHOOK_SECRET or not signature or not timestamp:
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > MAKEIT3D_WEBHOOK_TOLERANCE:
+            return False
+    except ValueError:
+        return False
+    expected = sign_makeit3d_payload(body, timestamp)
+    return hmac.compare_digest(expected, signature.removeprefix("sha256="))
+
+
+@makeit3d_webhook_router.post("/webhooks/makeit3d")
+async def makeit3d_task_callback(
+    request: Request,
+    x_makeit3d_signature: str = Header(None),
+    x_makeit3d_timestamp: str = Header(None),
+):
+    """
+    MakeIt3D task completion callback:
+    - Verifies the HMAC signature and timestamp
+    - Drops duplicate deliveries of the same task status
+    - Hands the result to the worker (same finalize stage as the poller)
+    """
+    body = await request.body()
+    if not verify_makeit3d_signature(body, x_makeit3d_signature, x_makeit3d_timestamp):
+        logger.warning("[MakeIt3D] Invalid callback signature")
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+
+    task_id = payload.get("task_id")
+    status = payload.get("status")
+    if not task_id or not status:
+        raise HTTPException(status_code=400, detail="Missing task_id or status")
+
+    if status not in ("complete", "failed"):
+        return {"ok": True}
+
+    dedupe_key = f"makeit3d:callback:{task_id}:{status}"
+    # Redis and the Celery publish are blocking clients; run them off the event loop
+    if not await asyncio.to_thread(redis_client.set, dedupe_key, 1, nx=True, ex=CALLBACK_DEDUPE_TTL):
+        logger.info(f"[MakeIt3D] Duplicate callback for {task_id} ({status})")
+        return {"ok": True, "duplicate": True}
+
+    try:
+        await asyncio.to_thread(handle_task_callback.delay, {
+            "task_id": task_id,
+            "status": status,
+            "asset_url": payload.get("asset_url"),
+        })
+    except Exception as e:
+        # Let the provider redeliver
+        await asyncio.to_thread(redis_client.delete, dedupe_key)
+        logger.error(f"[MakeIt3D] ❌ Failed to queue callback for {task_id}: {e}")
+        raise HTTPException(status_code=503, detail="Callback could not be queued")
+
+    logger.info(f"[MakeIt3D] 📬 Callback queued for {task_id} ({status})")
+    return {"ok": True}
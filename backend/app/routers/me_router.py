@@ -1,18 +1,13 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
-from supabase import create_client
 import jwt
 import os
-from app.services.supabase_service import get_shop_credits
+from app.services.async_supabase import get_db, get_shop_credits
 
 me_router = APIRouter()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 JWT_SECRET = os.getenv("JWT_SECRET")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-
 @me_router.get("/me")
 async def get_me(request: Request):
     token = request.cookies.get("session")
@@ -30,14 +25,15 @@ async def get_me(request: Request):
         raise HTTPException(status_code=401, detail="Invalid token")
 
     # Fetch shop record
-    result = supabase.table("shops").select("*").eq("shop", shop).maybe_single().execute()
-    shop_data = result.data or {}
+    db = await get_db()
+    result = await db.table("shops").select("*").eq("shop", shop).maybe_single().execute()
+    shop_data = getattr(result, "data", None) or {}
     if not shop_data:
         raise HTTPException(status_code=404, detail="Shop not found")
 
     # Fetch credits
     try:
-        credits = get_shop_credits(shop) or 0
+        credits = await get_shop_credits(shop) or 0
     except Exception as e:
         print(f"[get_me] Error fetching credits: {e}")
         credits = 0
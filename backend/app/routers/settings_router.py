@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException, Request, Depends, UploadFile, File
-from app.services.supabase_service import supabase
+import asyncio
+from app.services.async_supabase import get_db
 from app.dependencies.auth import get_current_shop
 from app.logging_config import logger
+from app.services.local_engine import OUTPUT_ENCODINGS
+from app.services.shop_settings import invalidate_shop_settings
+from app.services.signed_url_util import get_signed_url_async, invalidate_signed_urls_async
 
 settings_router = APIRouter()
 SETTINGS_TABLE = "settings"
@@ -10,14 +14,13 @@ AVATAR_BUCKET = "avatars"
 @settings_router.get("/settings")
 async def get_settings(shop: str = Depends(get_current_shop)):
     try:
-        response = supabase.table(SETTINGS_TABLE).select("*").eq("shop", shop).limit(1).execute()
+        db = await get_db()
+        response = await db.table(SETTINGS_TABLE).select("*").eq("shop", shop).limit(1).execute()
         data = response.data[0] if response.data else {}
 
         avatar_path = data.get("avatar_path")
         if avatar_path:
-            signed = supabase.storage.from_(AVATAR_BUCKET).create_signed_url(avatar_path, 3600 * 24 * 7)
-            if signed.get("signedURL"):
-                data["avatar_path"] = signed["signedURL"]
+            data["avatar_path"] = await get_signed_url_async(avatar_path, 3600 * 24 * 7, bucket=AVATAR_BUCKET)
 
         return data
     except Exception as e:
@@ -27,15 +30,28 @@ async def get_settings(shop: str = Depends(get_current_shop)):
 @settings_router.post("/settings")
 async def upsert_settings(request: Request, shop: str = Depends(get_current_shop)):
     try:
+        db = await get_db()
         body = await request.json()
         new_data = {
             "shop": shop,
             "background_removal": body.get("background_removal", False),
             "optimize_images": body.get("optimize_images", False),
         }
+        if "output_encoding" in body:
+            if body["output_encoding"] not in OUTPUT_ENCODINGS:
+                raise HTTPException(status_code=400, detail=f"output_encoding must be one of {', '.join(OUTPUT_ENCODINGS)}")
+            new_data["output_encoding"] = body["output_encoding"]
+        if "output_quality" in body:
+            quality = body["output_quality"]
+            if not isinstance(quality, int) or not 1 <= quality <= 100:
+                raise HTTPException(status_code=400, detail="output_quality must be an integer between 1 and 100")
+            new_data["output_quality"] = quality
 
-        response = supabase.table(SETTINGS_TABLE).upsert(new_data, on_conflict=["shop"]).execute()
+        response = await db.table(SETTINGS_TABLE).upsert(new_data, on_conflict=["shop"]).execute()
+        await asyncio.to_thread(invalidate_shop_settings, shop)
         return {"success": True, "data": response.data}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"POST /settings failed: {e}")
         raise HTTPException(status_code=500, detail="Error saving settings")
@@ -43,11 +59,12 @@ async def upsert_settings(request: Request, shop: str = Depends(get_current_shop
 @settings_router.post("/settings/avatar")
 async def upload_avatar(file: UploadFile = File(...), shop: str = Depends(get_current_shop)):
     try:
+        db = await get_db()
         contents = await file.read()
         ext = file.filename.split('.')[-1]
         avatar_path = f"{shop}/avatar.{ext}"
 
-        upload_res = supabase.storage.from_(AVATAR_BUCKET).upload(
+        upload_res = await db.storage.from_(AVATAR_BUCKET).upload(
             avatar_path,
             contents,
             {
@@ -58,16 +75,16 @@ async def upload_avatar(file: UploadFile = File(...), shop: str = Depends(get_cu
         if getattr(upload_res, "error", None):
             raise HTTPException(status_code=500, detail=f"Upload failed: {upload_res.error.message}")
 
-        supabase.table(SETTINGS_TABLE).upsert({
+        await db.table(SETTINGS_TABLE).upsert({
             "shop": shop,
             "avatar_path": avatar_path
         }, on_conflict=["shop"]).execute()
 
-        signed = supabase.storage.from_(AVATAR_BUCKET).create_signed_url(avatar_path, 3600 * 24 * 7)
-        if "signedURL" not in signed:
-            raise HTTPException(status_code=500, detail="Signed URL generation failed")
+        # Same path, new bytes: hand out a fresh URL so browsers don't show the old image
+        await invalidate_signed_urls_async([avatar_path], bucket=AVATAR_BUCKET)
+        url = await get_signed_url_async(avatar_path, 3600 * 24 * 7, bucket=AVATAR_BUCKET)
 
-        return {"url": signed["signedURL"]}
+        return {"url": url}
 
     except Exception as e:
         logger.error(f"POST /settings/avatar failed: {e}")
@@ -76,14 +93,15 @@ async def upload_avatar(file: UploadFile = File(...), shop: str = Depends(get_cu
 @settings_router.get("/settings/avatar/refresh")
 async def refresh_avatar_url(shop: str = Depends(get_current_shop)):
     try:
-        res = supabase.table(SETTINGS_TABLE).select("avatar_path").eq("shop", shop).limit(1).execute()
+        db = await get_db()
+        res = await db.table(SETTINGS_TABLE).select("avatar_path").eq("shop", shop).limit(1).execute()
         if not res.data or not res.data[0].get("avatar_path"):
             raise HTTPException(status_code=404, detail="Avatar not found")
 
         avatar_path = res.data[0]["avatar_path"]
-        signed = supabase.storage.from_(AVATAR_BUCKET).create_signed_url(avatar_path, 3600 * 24 * 7)
+        url = await get_signed_url_async(avatar_path, 3600 * 24 * 7, bucket=AVATAR_BUCKET)
 
-        return {"url": signed["signedURL"]}
+        return {"url": url}
     except Exception as e:
         logger.error(f"GET /settings/avatar/refresh failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,8 +1,8 @@
 # routers/shopify_webhooks.py
 from fastapi import APIRouter, Request, Header, HTTPException
-import os, hmac, hashlib, base64, json, logging
+import os, hmac, hashlib, base64, json, logging, asyncio
 from app.services.credits_service import ensure_shop_credits_row, add_credits_and_record, now_iso
-from app.services.supabase_service import supabase
+from app.services.async_supabase import get_db
 from app.config.plans import PLANS
 
 router = APIRouter(prefix="")
@@ -50,8 +50,9 @@ async def one_time_update(request: Request, x_shopify_hmac_sha256: str = Header(
         return {"ok": True}
 
     # idempotent credit add
-    ensure_shop_credits_row(x_shopify_shop_domain)
-    add_credits_and_record(
+    await asyncio.to_thread(ensure_shop_credits_row, x_shopify_shop_domain)
+    await asyncio.to_thread(
+        add_credits_and_record,
         shop=x_shopify_shop_domain,
         credits_to_add=PLANS[plan_key]["credits"],
         plan_id=plan_key,
@@ -60,7 +61,8 @@ async def one_time_update(request: Request, x_shopify_hmac_sha256: str = Header(
     )
 
     # update credit_pending if any
-    supabase.table("credit_pending").update({"status": "ACTIVE", "updated_at": now_iso()}) \
+    db = await get_db()
+    await db.table("credit_pending").update({"status": "ACTIVE", "updated_at": now_iso()}) \
         .eq("shop_domain", x_shopify_shop_domain).eq("purchase_id", purchase_id).execute()
 
     return {"ok": True}
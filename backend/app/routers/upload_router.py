@@ -1,19 +1,35 @@
 # upload_router.py
-from fastapi import APIRouter, UploadFile, File, HTTPException, Cookie, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Cookie, Form, Request
 from starlette.responses import JSONResponse
+import asyncio
 import uuid
 import os
 import jwt
 from typing import Optional
 from app.logging_config import logger
-from app.services.supabase_service import supabase
-from app.tasks.image_tasks import submit_job_task
-from app.services.supabase_service import deduct_shop_credit, add_shop_credits
+from app.services.async_supabase import get_db
+from app.services.signed_url_util import invalidate_signed_urls_async
+from app.tasks.image_tasks import queue_image_job, queue_image_jobs, complete_from_cache, release_upload_reservations
+from app.services.result_cache import cache_operation
+from app.config.operations import OPERATIONS, MAX_PIPELINE_STAGES
+from app.services.supabase_service import deduct_shop_credits_atomic, add_shop_credits
+from app.services.storage_stream import stream_file_to_storage, read_object_head
+from app.services.image_sniff import sniff_image_type, SNIFF_BYTES, ACCEPTED_IMAGE_TYPES
 
 upload_router = APIRouter()
 
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "makeit3d-public")
 JWT_SECRET = os.getenv("JWT_SECRET")
+# Per-file cap; the whole request body is capped earlier by BodySizeLimitMiddleware
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "200"))
+# Storage uploads in flight at once for a single batch request
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "8"))
+# Unfinalized direct uploads are refunded after this long (signed upload URLs live 2 hours)
+UPLOAD_RESERVATION_TTL = int(os.getenv("UPLOAD_RESERVATION_TTL", str(2 * 60 * 60 + 15 * 60)))
+
+# Declared content type -> extension for direct uploads; the bytes are sniffed again at finalize
+DIRECT_UPLOAD_EXTENSIONS = {mime: ext for ext, mime in ACCEPTED_IMAGE_TYPES.values()}
 
 
 def normalize_operation(op: str) -> str:
@@ -27,6 +43,31 @@ def normalize_operation(op: str) -> str:
     return mapping.get(op, op)
 
 
+def parse_stages(operation: Optional[str], pipeline: Optional[str]) -> list[str]:
+    """Operations to run in order: `pipeline` ("remove-bg,upscale") when given, else the single `operation`."""
+    raw = pipeline.split(",") if pipeline else [operation] if operation else []
+    stages = [normalize_operation(op.strip()) for op in raw if op and op.strip()]
+    if not stages:
+        raise HTTPException(status_code=400, detail="operation or pipeline is required")
+    if len(stages) > MAX_PIPELINE_STAGES:
+        raise HTTPException(status_code=400, detail=f"A pipeline can have at most {MAX_PIPELINE_STAGES} operations")
+    invalid = [op for op in stages if op not in OPERATIONS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid operation: {', '.join(invalid)}")
+    return stages
+
+
+async def read_json_object(request: Request) -> dict:
+    """The request body as a JSON object; anything else is a 400."""
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Body must be a JSON object")
+    return body
+
+
 def get_shop_from_cookie(session: Optional[str]) -> str:
     if not session:
         raise HTTPException(status_code=401, detail="No session token found")
@@ -41,33 +82,53 @@ def get_shop_from_cookie(session: Optional[str]) -> str:
         raise HTTPException(status_code=401, detail="Invalid session token")
 
 
-async def process_single_file(file: UploadFile, operation: str, shop: str):
-    """Upload one file, insert DB record, deduct credit, and queue Celery job."""
-    filename = f"{uuid.uuid4()}.png"
-    path = f"{shop}/upload/{filename}"
+def ingest_file(file: UploadFile, shop: str) -> dict:
+    """
+    Check one upload and stream it into storage in chunks (blocking; run it in a thread).
+    The type comes from the file's magic bytes, not from its name or the client's MIME type.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
 
-    # Read file content
-    file_content = await file.read()
+    file.file.seek(0)
+    kind = sniff_image_type(file.file.read(SNIFF_BYTES))
+    if not kind:
+        raise HTTPException(status_code=415, detail="Unsupported file type. Upload a JPEG, PNG or WebP image.")
+    ext, content_type = kind
+    file.file.seek(0)
 
-    # Upload to Supabase Storage
+    path = f"{shop}/upload/{uuid.uuid4()}.{ext}"
     try:
-        supabase.storage.from_(SUPABASE_BUCKET).upload(
-            path=path,
-            file=file_content,
-            file_options={"content-type": file.content_type},
+        input_sha256, stats = stream_file_to_storage(
+            file.file, SUPABASE_BUCKET, path, content_type, total_length=file.size
         )
-        logger.info(f"Upload succeeded for {path}")
+        logger.info(f"Upload succeeded for {path} ({stats['bytes']} bytes in {stats['seconds']}s)")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Supabase upload failed: {e}")
 
+    return {"filename": file.filename, "path": path, "input_sha256": input_sha256}
+
+
+async def process_single_file(file: UploadFile, stages: list[str], shop: str):
+    """Upload one file, insert DB record, deduct one credit per stage, and queue the job fairly."""
+    operation = stages[-1]
+    pipeline = stages if len(stages) > 1 else None
+    # Stream the spooled upload to storage; the image is never held in memory as a whole
+    stored = await asyncio.to_thread(ingest_file, file, shop)
+    path = stored["path"]
+    input_sha256 = stored["input_sha256"]
+
     # Insert DB row
+    db = await get_db()
     try:
-        insert_response = supabase.table("images").insert({
+        insert_response = await db.table("images").insert({
             "shop": shop,
             "original_path": path,
             "status": "pending",
             "operation": operation,
             "filename": file.filename,
+            "input_sha256": input_sha256,
+            "pipeline": pipeline,
         }).execute()
 
         data = getattr(insert_response, "data", None)
@@ -79,33 +140,46 @@ async def process_single_file(file: UploadFile, operation: str, shop: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database insert failed: {e}")
 
-    # Deduct 1 credit
+    # Deduct one credit per stage, in a single deduction
+    credits = len(stages)
     try:
-        remaining = deduct_shop_credit(shop, amount=1)
+        remaining = await asyncio.to_thread(deduct_shop_credits_atomic, shop, credits)
         # Mark in images table that credit was deducted
-        supabase.table("images").update({"credits_deducted": True}).eq("id", image_id).execute()
-        logger.info(f"💰 Deducted 1 credit from {shop}. Remaining: {remaining}")
+        await db.table("images").update({"credits_deducted": True}).eq("id", image_id).execute()
+        logger.info(f"💰 Deducted {credits} credit(s) from {shop}. Remaining: {remaining}")
     except ValueError:
-        supabase.table("images").delete().eq("id", image_id).execute()
+        await db.table("images").delete().eq("id", image_id).execute()
         raise HTTPException(status_code=402, detail={
             "message": "Not enough credits. Please purchase more.",
             "remaining_credits": 0
         })
 
-    # Queue Celery job
+    # ♻️ Same bytes + operation processed before: reuse that output, no provider call
     try:
-        task_result = submit_job_task.delay(image_id, operation, path, shop)
-        celery_job_id = task_result.id
+        if await asyncio.to_thread(complete_from_cache, image_id, shop, input_sha256, cache_operation(stages)):
+            return {
+                "id": image_id,
+                "filename": file.filename,
+                "status": "processed",
+                "queue_position": 0,
+                "remaining_credits": remaining
+            }
     except Exception as e:
-        add_shop_credits(shop, 1, "Refund: queue failed")
-        supabase.table("images").delete().eq("id", image_id).execute()
+        logger.warning(f"Result cache check failed for {image_id}, queueing normally: {e}")
+
+    # Queue in the shop's fair queue; the dispatcher feeds image_queue round-robin
+    try:
+        queue_position = await asyncio.to_thread(queue_image_job, image_id, operation, path, shop, input_sha256, pipeline)
+    except Exception as e:
+        await asyncio.to_thread(add_shop_credits, shop, credits, "Refund: queue failed")
+        await db.table("images").delete().eq("id", image_id).execute()
         raise HTTPException(status_code=500, detail=f"Queueing job failed: {e}")
 
     return {
         "id": image_id,
         "filename": file.filename,
         "status": "queued",
-        "celery_job_id": celery_job_id,
+        "queue_position": queue_position,
         "remaining_credits": remaining
     }
 
@@ -113,14 +187,16 @@ async def process_single_file(file: UploadFile, operation: str, shop: str):
 @upload_router.post("/upload")
 async def upload_image(
     file: UploadFile = File(...),
-    operation: str = Form(...),
+    operation: Optional[str] = Form(None),
+    pipeline: Optional[str] = Form(None),
     session: str = Cookie(None),
 ):
+    """`pipeline` chains operations in order, e.g. "remove-bg,upscale", as one job charged one credit per stage."""
     shop = get_shop_from_cookie(session)
-    operation = normalize_operation(operation)
+    stages = parse_stages(operation, pipeline)
 
     try:
-        result = await process_single_file(file, operation, shop)
+        result = await process_single_file(file, stages, shop)
         return JSONResponse(content=result, status_code=202)
     except HTTPException:
         raise
@@ -129,22 +205,377 @@ async def upload_image(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def upload_to_storage(file: UploadFile, shop: str, semaphore: asyncio.Semaphore) -> dict:
+    """Store one file of a batch. Never raises: failures come back as {"error": ...}."""
+    try:
+        async with semaphore:
+            return await asyncio.to_thread(ingest_file, file, shop)
+    except HTTPException as e:
+        logger.error(f"Batch upload failed for {file.filename}: {e.detail}")
+        return {"filename": file.filename, "error": e.detail}
+    except Exception as e:
+        logger.error(f"Batch upload failed for {file.filename}: {e}")
+        return {"filename": file.filename, "error": f"Supabase upload failed: {e}"}
+
+
+@upload_router.post("/upload/batch")
+async def upload_batch(
+    files: list[UploadFile] = File(...),
+    operation: Optional[str] = Form(None),
+    pipeline: Optional[str] = Form(None),
+    session: str = Cookie(None),
+):
+    """
+    Upload many files as one request: concurrent storage writes, one credit deduction,
+    one bulk insert and one grouped enqueue. Returns a result per file, in request order.
+    """
+    shop = get_shop_from_cookie(session)
+    stages = parse_stages(operation, pipeline)
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {UPLOAD_BATCH_MAX_FILES} files")
+
+    operation = stages[-1]
+    pipeline = stages if len(stages) > 1 else None
+    per_file = len(stages)
+
+    # Charge the whole batch up front in one atomic step; failed files are refunded below
+    try:
+        remaining = await asyncio.to_thread(deduct_shop_credits_atomic, shop, per_file * len(files))
+    except ValueError:
+        raise HTTPException(status_code=402, detail={
+            "message": "Not enough credits. Please purchase more.",
+            "remaining_credits": 0
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Credit deduction failed: {e}")
+    logger.info(f"💰 Deducted {per_file * len(files)} credit(s) from {shop} for a batch of {len(files)}")
+
+    semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+    uploads = await asyncio.gather(*(upload_to_storage(f, shop, semaphore) for f in files))
+    stored = [u for u in uploads if "error" not in u]
+
+    db = await get_db()
+    rows = []
+    if stored:
+        try:
+            insert_response = await db.table("images").insert([{
+                "shop": shop,
+                "original_path": u["path"],
+                "status": "pending",
+                "operation": operation,
+                "filename": u["filename"],
+                "input_sha256": u["input_sha256"],
+                "pipeline": pipeline,
+                "credits_deducted": True,
+            } for u in stored]).execute()
+            rows = getattr(insert_response, "data", None) or []
+            if len(rows) != len(stored):
+                raise Exception(f"expected {len(stored)} rows, got {len(rows)}")
+        except Exception as e:
+            logger.error(f"Batch insert failed for {shop}: {e}")
+            await asyncio.to_thread(add_shop_credits, shop, per_file * len(files), "Refund: batch insert failed")
+            try:
+                await db.storage.from_(SUPABASE_BUCKET).remove([u["path"] for u in stored])
+                await invalidate_signed_urls_async(u["path"] for u in stored)
+            except Exception as cleanup_error:
+                logger.warning(f"Could not remove orphaned batch uploads: {cleanup_error}")
+            raise HTTPException(status_code=500, detail=f"Database insert failed: {e}")
+
+    # Rows come back in insert order; map them by path anyway so nothing relies on it
+    image_ids = {row["original_path"]: row["id"] for row in rows}
+
+    jobs = [{
+        "image_id": image_ids[u["path"]],
+        "operation": operation,
+        "image_path": u["path"],
+        "shop": shop,
+        "input_sha256": u["input_sha256"],
+        "pipeline": pipeline,
+    } for u in stored]
+
+    queued = {}
+    if jobs:
+        # Cache hits are resolved by submit_job_task without a provider call
+        try:
+            positions = await asyncio.to_thread(queue_image_jobs, jobs)
+            queued = {job["image_path"]: pos for job, pos in zip(jobs, positions)}
+        except Exception as e:
+            logger.error(f"Batch enqueue failed for {shop}: {e}")
+            await db.table("images").update({
+                "status": "failed",
+                "error_message": f"Queueing job failed: {e}",
+                "credits_deducted": False,
+            }).in_("id", list(image_ids.values())).execute()
+
+    failed = len(files) - len(queued)
+    if failed:
+        await asyncio.to_thread(add_shop_credits, shop, per_file * failed, "Refund: batch upload failed")
+        remaining += per_file * failed
+        logger.info(f"💸 Refunded {per_file * failed} credit(s) to {shop} for {failed} failed file(s)")
+
+    results = []
+    for u in uploads:
+        if "error" in u:
+            results.append({"filename": u["filename"], "status": "failed", "error": u["error"]})
+        elif u["path"] not in queued:
+            results.append({"id": image_ids[u["path"]], "filename": u["filename"], "status": "failed", "error": "Queueing job failed"})
+        else:
+            results.append({
+                "id": image_ids[u["path"]],
+                "filename": u["filename"],
+                "status": "queued",
+                "queue_position": queued[u["path"]],
+            })
+
+    return JSONResponse(content={
+        "results": results,
+        "queued": len(queued),
+        "failed": failed,
+        "remaining_credits": remaining,
+    }, status_code=202)
+
+
+async def create_upload_url(path: str) -> dict:
+    db = await get_db()
+    result = await db.storage.from_(SUPABASE_BUCKET).create_signed_upload_url(path)
+    signed_url = result.get("signed_url") or result.get("signedUrl")
+    if not signed_url:
+        raise Exception("No signed upload URL in response")
+    return {"signed_url": signed_url, "token": result.get("token")}
+
+
+@upload_router.post("/upload/init")
+async def init_direct_upload(request: Request, session: str = Cookie(None)):
+    """
+    Step 1 of a direct upload: reserve credits and hand out signed upload URLs.
+    Body: {"files": [{"filename", "content_type", "size"}], "operation" | "pipeline"}.
+    The browser PUTs each file to its `signed_url`, then calls /upload/finalize.
+    """
+    shop = get_shop_from_cookie(session)
+    body = await read_json_object(request)
+    operation, pipeline = body.get("operation"), body.get("pipeline")
+    if not isinstance(operation, (str, type(None))) or not isinstance(pipeline, (str, type(None))):
+        raise HTTPException(status_code=400, detail="operation and pipeline must be strings")
+    stages = parse_stages(operation, pipeline)
+    files = body.get("files")
+    if not isinstance(files, list) or not files:
+        raise HTTPException(status_code=400, detail="files is required")
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {UPLOAD_BATCH_MAX_FILES} files")
+    for f in files:
+        if not isinstance(f, dict):
+            raise HTTPException(status_code=400, detail="Each file must be an object with filename, content_type and size")
+        size = f.get("size") or 0
+        if isinstance(size, bool) or not isinstance(size, int) or size < 0:
+            raise HTTPException(status_code=400, detail=f"Invalid size for {f.get('filename')}")
+        if f.get("content_type") not in DIRECT_UPLOAD_EXTENSIONS:
+            raise HTTPException(status_code=415, detail=f"Unsupported file type for {f.get('filename')}. Upload a JPEG, PNG or WebP image.")
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"{f.get('filename')} exceeds {MAX_UPLOAD_BYTES} bytes")
+
+    operation = stages[-1]
+    pipeline = stages if len(stages) > 1 else None
+    credits = len(stages) * len(files)
+    try:
+        remaining = await asyncio.to_thread(deduct_shop_credits_atomic, shop, credits, "Image processing (direct upload)")
+    except ValueError:
+        raise HTTPException(status_code=402, detail={
+            "message": "Not enough credits. Please purchase more.",
+            "remaining_credits": 0
+        })
+
+    paths = [f"{shop}/upload/{uuid.uuid4()}.{DIRECT_UPLOAD_EXTENSIONS[f['content_type']]}" for f in files]
+    try:
+        semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+        async def signed(path: str) -> dict:
+            async with semaphore:
+                return await create_upload_url(path)
+
+        urls = await asyncio.gather(*(signed(p) for p in paths))
+
+        db = await get_db()
+        insert_response = await db.table("images").insert([{
+            "shop": shop,
+            "original_path": path,
+            "status": "awaiting_upload",
+            "operation": operation,
+            "filename": f.get("filename") or os.path.basename(path),
+            "pipeline": pipeline,
+            "credits_deducted": True,
+        } for f, path in zip(files, paths)]).execute()
+        rows = getattr(insert_response, "data", None) or []
+        if len(rows) != len(paths):
+            raise Exception(f"expected {len(paths)} rows, got {len(rows)}")
+    except Exception as e:
+        await asyncio.to_thread(add_shop_credits, shop, credits, "Refund: upload init failed")
+        raise HTTPException(status_code=500, detail=f"Upload init failed: {e}")
+
+    image_ids = {row["original_path"]: row["id"] for row in rows}
+    await asyncio.to_thread(
+        release_upload_reservations.apply_async,
+        args=[list(image_ids.values()), shop],
+        countdown=UPLOAD_RESERVATION_TTL,
+    )
+    logger.info(f"💰 Reserved {credits} credit(s) from {shop} for {len(files)} direct upload(s)")
+
+    return {
+        "files": [{
+            "id": image_ids[path],
+            "filename": f.get("filename"),
+            "path": path,
+            "signed_url": url["signed_url"],
+            "token": url["token"],
+        } for f, path, url in zip(files, paths, urls)],
+        "expires_in": UPLOAD_RESERVATION_TTL,
+        "remaining_credits": remaining,
+    }
+
+
+def check_direct_upload(row: dict) -> Optional[str]:
+    """None when the uploaded object is a valid image, else why not ("missing" if not uploaded yet)."""
+    head = read_object_head(SUPABASE_BUCKET, row["original_path"], SNIFF_BYTES)
+    if head is None:
+        return "missing"
+    data, size = head
+    if size > MAX_UPLOAD_BYTES:
+        return f"File exceeds {MAX_UPLOAD_BYTES} bytes"
+    if not sniff_image_type(data):
+        return "Unsupported file type. Upload a JPEG, PNG or WebP image."
+    return None
+
+
+@upload_router.post("/upload/finalize")
+async def finalize_direct_upload(request: Request, session: str = Cookie(None)):
+    """
+    Step 2 of a direct upload: check the objects landed and queue them.
+    Body: {"image_ids": [...]}. Files not uploaded yet come back as "awaiting_upload"
+    and can be finalized again until the reservation expires.
+    """
+    shop = get_shop_from_cookie(session)
+    body = await read_json_object(request)
+    image_ids = body.get("image_ids")
+    if not isinstance(image_ids, list) or not image_ids:
+        raise HTTPException(status_code=400, detail="image_ids is required")
+    if len(image_ids) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {UPLOAD_BATCH_MAX_FILES} files")
+    try:
+        image_ids = [str(uuid.UUID(i)) for i in image_ids]
+    except (TypeError, ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="image_ids must be UUIDs")
+
+    db = await get_db()
+    res = await db.table("images") \
+        .select("id, filename, original_path, operation, pipeline, status") \
+        .in_("id", image_ids) \
+        .eq("shop", shop) \
+        .execute()
+    rows = {row["id"]: row for row in res.data or []}
+
+    semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+    async def check(row: dict) -> Optional[str]:
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(check_direct_upload, row)
+            except Exception as e:
+                logger.warning(f"Could not check direct upload {row['id']}: {e}")
+                return "missing"
+
+    pending = [row for row in rows.values() if row["status"] == "awaiting_upload"]
+    problems = dict(zip((row["id"] for row in pending), await asyncio.gather(*(check(row) for row in pending))))
+
+    ready = [image_id for image_id, problem in problems.items() if problem is None]
+    rejected = {image_id: problem for image_id, problem in problems.items() if problem not in (None, "missing")}
+
+    # Conditional on the status, so a concurrent finalize or expiry cannot queue or refund twice
+    claimed = set()
+    if ready:
+        claim = await db.table("images") \
+            .update({"status": "pending"}) \
+            .in_("id", ready) \
+            .eq("status", "awaiting_upload") \
+            .execute()
+        claimed = {row["id"] for row in claim.data or []}
+
+    if rejected:
+        refund = 0
+        for image_id, problem in rejected.items():
+            failed = await db.table("images").update({
+                "status": "failed",
+                "error_message": problem,
+                "credits_deducted": False,
+            }).eq("id", image_id).eq("status", "awaiting_upload").execute()
+            if failed.data:
+                refund += len(rows[image_id].get("pipeline") or []) or 1
+        if refund:
+            await asyncio.to_thread(add_shop_credits, shop, refund, "Refund: invalid direct upload")
+        try:
+            await db.storage.from_(SUPABASE_BUCKET).remove([rows[i]["original_path"] for i in rejected])
+            await invalidate_signed_urls_async(rows[i]["original_path"] for i in rejected)
+        except Exception as e:
+            logger.warning(f"Could not remove rejected direct uploads: {e}")
+
+    queued = {}
+    jobs = [{
+        "image_id": image_id,
+        "operation": rows[image_id]["operation"],
+        "image_path": rows[image_id]["original_path"],
+        "shop": shop,
+        "input_sha256": None,
+        "pipeline": rows[image_id].get("pipeline"),
+    } for image_id in claimed]
+    if jobs:
+        try:
+            positions = await asyncio.to_thread(queue_image_jobs, jobs)
+            queued = {job["image_id"]: pos for job, pos in zip(jobs, positions)}
+        except Exception as e:
+            # Hand the rows back so finalize can be retried; the reservation expiry still refunds them
+            logger.error(f"Direct upload enqueue failed for {shop}: {e}")
+            await db.table("images").update({"status": "awaiting_upload"}).in_("id", list(claimed)).execute()
+            raise HTTPException(status_code=500, detail=f"Queueing job failed: {e}")
+
+    results = []
+    for image_id in image_ids:
+        row = rows.get(image_id)
+        if not row:
+            results.append({"id": image_id, "status": "not_found"})
+        elif image_id in queued:
+            results.append({"id": image_id, "filename": row["filename"], "status": "queued", "queue_position": queued[image_id]})
+        elif image_id in rejected:
+            results.append({"id": image_id, "filename": row["filename"], "status": "failed", "error": rejected[image_id]})
+        elif problems.get(image_id) == "missing":
+            results.append({"id": image_id, "filename": row["filename"], "status": "awaiting_upload"})
+        else:
+            # Finalized earlier (or expired): report its current state
+            results.append({"id": image_id, "filename": row["filename"], "status": row["status"]})
+
+    return JSONResponse(content={"results": results, "queued": len(queued)}, status_code=202)
+
+
 @upload_router.get("/images/{image_id}")
 async def get_image_status(image_id: str, session: str = Cookie(None)):
     shop = get_shop_from_cookie(session)
     try:
-        result = supabase.table("images") \
+        image_id = str(uuid.UUID(image_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    try:
+        db = await get_db()
+        result = await db.table("images") \
             .select("*") \
             .eq("id", image_id) \
             .eq("shop", shop) \
-            .single() \
+            .limit(1) \
             .execute()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
-    data = getattr(result, "data", None)
-    if not data:
+    rows = getattr(result, "data", None)
+    if not rows:
         raise HTTPException(status_code=404, detail="Image not found")
+    data = rows[0]
 
     return {
         "id": data.get("id"),
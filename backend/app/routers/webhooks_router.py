@@ -1,5 +1,8 @@
 from fastapi import APIRouter, Request, HTTPException
-from app.services.supabase_service import supabase
+from app.services.async_supabase import get_db
+from app.services.signed_url_util import invalidate_signed_url_prefix_async
+from app.services import download_cache
+import asyncio
 from app.logging_config import logger
 import hmac
 import hashlib
@@ -44,12 +47,17 @@ async def handle_uninstall(request: Request):
         # Delete image files from Supabase Storage
         await delete_images_from_storage(shop)
 
+        # Cached signed URLs and downloaded copies of those files must not outlive them
+        await invalidate_signed_url_prefix_async(f"{shop}/")
+        await asyncio.to_thread(download_cache.invalidate_prefix, f"{shop}/")
+
         # Delete image records from Supabase DB
-        img_res = supabase.table("images").delete().eq("shop", shop).execute()
+        db = await get_db()
+        img_res = await db.table("images").delete().eq("shop", shop).execute()
         logger.info(f"[Webhook] 🗑️ Deleted {len(img_res.data)} image records from DB")
 
         # Delete shop record
-        shop_res = supabase.table("shops").delete().eq("shop", shop).execute()
+        shop_res = await db.table("shops").delete().eq("shop", shop).execute()
         logger.info(f"[Webhook] 🧹 Deleted shop record for {shop}")
 
         return {"message": f"Uninstall cleanup completed for {shop}"}
@@ -64,7 +72,8 @@ async def delete_images_from_storage(shop: str):
     """
     try:
         bucket = "makeit3d-public"
-        list_response = supabase.storage.from_(bucket).list(path=shop)
+        db = await get_db()
+        list_response = await db.storage.from_(bucket).list(path=shop)
         files = list_response.get("data", [])
 
         if not files:
@@ -72,7 +81,7 @@ async def delete_images_from_storage(shop: str):
             return
 
         file_paths = [f"{shop}/{file['name']}" for file in files]
-        delete_response = supabase.storage.from_(bucket).remove(file_paths)
+        delete_response = await db.storage.from_(bucket).remove(file_paths)
 
         if delete_response.get("error"):
             logger.error(f"[Storage] ❌ Failed to delete files: {delete_response['error']}")
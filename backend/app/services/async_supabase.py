@@ -0,0 +1,89 @@
+# app/services/async_supabase.py
+import os
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+from supabase import AsyncClient, acreate_client
+from supabase.lib.client_options import AsyncClientOptions
+
+logger = logging.getLogger("async_supabase")
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# One connection pool per API process, shared by PostgREST, storage and RPC calls
+ASYNC_DB_MAX_CONNECTIONS = int(os.getenv("ASYNC_DB_MAX_CONNECTIONS", "50"))
+ASYNC_DB_KEEPALIVE = int(os.getenv("ASYNC_DB_KEEPALIVE", "20"))
+ASYNC_DB_TIMEOUT = float(os.getenv("ASYNC_DB_TIMEOUT", "10"))
+
+_client: Optional[AsyncClient] = None
+_http: Optional[httpx.AsyncClient] = None
+_lock = asyncio.Lock()
+
+
+async def get_db() -> AsyncClient:
+    """
+    Async Supabase client for request handlers. Awaiting its queries never blocks the
+    event loop, unlike supabase_service.supabase, which stays for Celery and sync helpers.
+    """
+    global _client, _http
+    if _client is not None:
+        return _client
+    async with _lock:
+        if _client is None:
+            _http = httpx.AsyncClient(
+                timeout=ASYNC_DB_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=ASYNC_DB_MAX_CONNECTIONS,
+                    max_keepalive_connections=ASYNC_DB_KEEPALIVE,
+                ),
+            )
+            _client = await acreate_client(
+                SUPABASE_URL,
+                SUPABASE_SERVICE_ROLE_KEY,
+                options=AsyncClientOptions(httpx_client=_http, postgrest_client_timeout=ASYNC_DB_TIMEOUT),
+            )
+            logger.info(f"✅ Async Supabase client ready (pool of {ASYNC_DB_MAX_CONNECTIONS})")
+    return _client
+
+
+async def get_http() -> httpx.AsyncClient:
+    """The pooled HTTP client behind get_db(), for raw requests to the same Supabase host (e.g. signed URLs)."""
+    await get_db()
+    return _http
+
+
+async def close_db():
+    global _client, _http
+    if _http is not None:
+        await _http.aclose()
+    _client = None
+    _http = None
+
+
+async def get_shop_credits(shop_domain: str) -> int:
+    db = await get_db()
+    res = await db.table("shop_credits").select("credits").eq("shop_domain", shop_domain).limit(1).execute()
+    return res.data[0]["credits"] if res.data else 0
+
+
+async def create_signed_url(bucket: str, path: str, expires_in: int) -> str:
+    db = await get_db()
+    result = await db.storage.from_(bucket).create_signed_url(path, expires_in)
+    signed_url = result.get("signedURL") or result.get("signed_url")
+    if not signed_url:
+        raise Exception("No signed URL in response")
+    return signed_url
+
+
+async def create_signed_urls(bucket: str, paths: list[str], expires_in: int) -> dict[str, Optional[str]]:
+    """Sign many paths in one storage request. Paths that could not be signed map to None."""
+    db = await get_db()
+    results = await db.storage.from_(bucket).create_signed_urls(paths, expires_in)
+    signed = {path: None for path in paths}
+    for item in results:
+        if not item.get("error") and item.get("path") in signed:
+            signed[item["path"]] = item.get("signedURL") or item.get("signedUrl")
+    return signed
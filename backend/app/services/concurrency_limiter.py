@@ -0,0 +1,114 @@
+# app/services/concurrency_limiter.py
+import os
+import time
+import uuid
+import logging
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from app.services.redis_service import redis_client
+
+logger = logging.getLogger("concurrency_limiter")
+
+AIMD_INITIAL_WINDOW = float(os.getenv("AIMD_INITIAL_WINDOW", "8"))
+AIMD_MIN_WINDOW = float(os.getenv("AIMD_MIN_WINDOW", "1"))
+AIMD_MAX_WINDOW = float(os.getenv("AIMD_MAX_WINDOW", "100"))
+AIMD_DECREASE_FACTOR = float(os.getenv("AIMD_DECREASE_FACTOR", "0.5"))
+# Calls slower than this count as congestion, like an error
+AIMD_LATENCY_TARGET_MS = int(os.getenv("AIMD_LATENCY_TARGET_MS", "5000"))
+# At most one multiplicative decrease per cooldown, so a burst of errors from
+# the same congestion event does not collapse the window to the floor
+AIMD_DECREASE_COOLDOWN_S = float(os.getenv("AIMD_DECREASE_COOLDOWN", "2"))
+
+
+# KEYS: 1 inflight (ZSET token -> expiry), 2 window
+# ARGV: 1 now, 2 token, 3 slot_ttl, 4 initial window
+LUA_ACQUIRE = r"""
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local window = tonumber(redis.call('GET', KEYS[2])) or tonumber(ARGV[4])
+local inflight = redis.call('ZCARD', KEYS[1])
+if inflight < math.max(1, math.floor(window)) then
+  redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[2])
+  return 1
+end
+return 0
+"""
+
+# KEYS: 1 window, 2 last_decrease
+# ARGV: 1 now, 2 congested (0/1), 3 initial, 4 min, 5 max, 6 factor, 7 cooldown
+LUA_RECORD = r"""
+local now = tonumber(ARGV[1])
+local window = tonumber(redis.call('GET', KEYS[1])) or tonumber(ARGV[3])
+if ARGV[2] == '1' then
+  local last = tonumber(redis.call('GET', KEYS[2])) or 0
+  if now - last >= tonumber(ARGV[7]) then
+    window = math.max(tonumber(ARGV[4]), window * tonumber(ARGV[6]))
+    redis.call('SET', KEYS[2], now)
+  end
+else
+  window = math.min(tonumber(ARGV[5]), window + 1 / window)
+end
+redis.call('SET', KEYS[1], tostring(window))
+return tostring(window)
+"""
+
+_acquire = redis_client.register_script(LUA_ACQUIRE)
+_record = redis_client.register_script(LUA_RECORD)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Cluster-wide AIMD concurrency window kept in Redis. Every worker takes a slot
+    before calling the provider and records the call's outcome: successes grow
+    the window by ~1 per window's worth of calls, errors or slow calls halve it.
+    Slots expire after slot_ttl so a crashed worker cannot leak them.
+    """
+
+    def __init__(self, name: str, slot_ttl: float):
+        self.inflight_key = f"aimd:{name}:inflight"
+        self.window_key = f"aimd:{name}:window"
+        self.decrease_key = f"aimd:{name}:last_decrease"
+        self.slot_ttl = slot_ttl
+
+    def try_acquire(self) -> Optional[str]:
+        """Returns a slot token, or None when the window is full. Fails open on Redis errors."""
+        token = uuid.uuid4().hex
+        try:
+            granted = _acquire(
+                keys=[self.inflight_key, self.window_key],
+                args=[time.time(), token, self.slot_ttl, AIMD_INITIAL_WINDOW],
+            )
+        except RedisError as e:
+            logger.error(f"[AIMD] Redis error, not limiting: {e}")
+            return token
+        return token if granted else None
+
+    def record_outcome(self, latency_ms: int, error: bool = False):
+        """Feed one provider call back into the window: grow on success, shrink on congestion."""
+        congested = error or latency_ms > AIMD_LATENCY_TARGET_MS
+        try:
+            window = _record(
+                keys=[self.window_key, self.decrease_key],
+                args=[
+                    time.time(), int(congested),
+                    AIMD_INITIAL_WINDOW, AIMD_MIN_WINDOW, AIMD_MAX_WINDOW,
+                    AIMD_DECREASE_FACTOR, AIMD_DECREASE_COOLDOWN_S,
+                ],
+            )
+            if congested:
+                logger.warning(f"[AIMD] Congestion (error={error}, latency={latency_ms}ms), window now {float(window):.1f}")
+        except RedisError as e:
+            logger.error(f"[AIMD] Redis error recording outcome: {e}")
+
+    def release(self, token: str):
+        try:
+            redis_client.zrem(self.inflight_key, token)
+        except RedisError as e:
+            # The slot expires on its own after slot_ttl
+            logger.error(f"[AIMD] Redis error releasing slot: {e}")
+
+    def window(self) -> float:
+        value = redis_client.get(self.window_key)
+        return float(value) if value else AIMD_INITIAL_WINDOW
@@ -70,6 +70,9 @@ def add_credits_and_record(shop: str, credits_to_add: int, plan_id: str, source:
         "created_at": now_iso()
     }).execute()
 
+    # remember the plan; it sets the shop's share of the image queue
+    supabase.table("shops").update({"plan": plan_id}).eq("shop", shop).execute()
+
     # mark pending if exists
     supabase.table("credit_pending").update({
         "status": "COMPLETED",
@@ -0,0 +1,53 @@
+# app/services/derivatives.py
+import io
+import os
+import logging
+from pathlib import PurePosixPath
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger("derivatives")
+
+# name -> (longest edge in px, WebP quality); largest first, each is resized from the previous
+DERIVATIVES = {
+    "preview": (int(os.getenv("PREVIEW_MAX_EDGE", "1024")), 80),
+    "thumbnail": (int(os.getenv("THUMBNAIL_MAX_EDGE", "256")), 75),
+}
+DERIVATIVE_CONTENT_TYPE = "image/webp"
+
+
+def derivative_path(processed_path: str, name: str) -> str:
+    """`shop/processed/abc.png` -> `shop/processed/abc_thumbnail.webp`, next to the original."""
+    path = PurePosixPath(processed_path)
+    return str(path.with_name(f"{path.stem}_{name}.webp"))
+
+
+def make_derivatives(data: bytes) -> dict[str, bytes]:
+    """Encode a WebP per entry in DERIVATIVES. Never upscales small images."""
+    out = {}
+    with Image.open(io.BytesIO(data)) as source:
+        img = ImageOps.exif_transpose(source)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+        for name, (max_edge, quality) in DERIVATIVES.items():
+            if max(img.size) > max_edge:
+                img = img.resize(_fit(img.size, max_edge), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, "WEBP", quality=quality, method=4)
+            out[name] = buf.getvalue()
+    return out
+
+
+def _fit(size: tuple[int, int], max_edge: int) -> tuple[int, int]:
+    width, height = size
+    scale = max_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def display_path(image: dict, variant: str = "thumbnail") -> Optional[str]:
+    """Storage path to show for an images row: the requested derivative, else the full processed image."""
+    if variant in DERIVATIVES and image.get(f"{variant}_path"):
+        return image[f"{variant}_path"]
+    return image.get("processed_path")
@@ -0,0 +1,249 @@
+# app/services/download_cache.py
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+import requests
+from prometheus_client import Counter
+from app.services.signed_url_util import get_signed_url
+
+logger = logging.getLogger("download_cache")
+
+# Bounded on-disk LRU of downloaded files, shared by every API worker on the host.
+# Entries are keyed by storage path and remember the object's ETag, so a changed object is
+# fetched again instead of served stale.
+DOWNLOAD_CACHE_ENABLED = os.getenv("DOWNLOAD_CACHE_ENABLED", "true").lower() == "true"
+DOWNLOAD_CACHE_DIR = Path(os.getenv("DOWNLOAD_CACHE_DIR", "/tmp/maxflow-download-cache"))
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+DOWNLOAD_CACHE_MAX_FILE_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+# A hit is served without asking storage for this long after its ETag was last confirmed;
+# after that storage is asked with If-None-Match and answers 304 while nothing changed
+DOWNLOAD_CACHE_REVALIDATE_AFTER = int(os.getenv("DOWNLOAD_CACHE_REVALIDATE_AFTER", "300"))
+# Eviction trims down to this share of the budget, so it does not run on every write
+DOWNLOAD_CACHE_LOW_WATER = 0.9
+# Workers store fresh results right away; only useful when they share the API's disk
+DOWNLOAD_CACHE_PREWARM = os.getenv("DOWNLOAD_CACHE_PREWARM", "false").lower() == "true"
+
+download_cache_lookups = Counter(
+    "download_cache_lookups_total",
+    "Download cache lookups by outcome (hit, revalidated, miss)",
+    ["outcome"],
+)
+
+_size_lock = threading.Lock()
+_approx_bytes: Optional[int] = None
+
+
+def _entry_paths(path: str) -> tuple[Path, Path]:
+    key = hashlib.sha256(path.encode("utf-8")).hexdigest()
+    folder = DOWNLOAD_CACHE_DIR / key[:2]
+    return folder / f"{key}.bin", folder / f"{key}.json"
+
+
+def lookup(path: str) -> Optional[dict]:
+    """The cached entry for a storage path ({file, etag, content_type, size, validated_at}), or None."""
+    data_path, meta_path = _entry_paths(path)
+    try:
+        meta = json.loads(meta_path.read_text())
+        if data_path.stat().st_size != meta["size"]:
+            return None
+        # Recently used files are the last to be evicted
+        os.utime(data_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    meta["file"] = str(data_path)
+    return meta
+
+
+def is_fresh(entry: dict) -> bool:
+    return time.time() - entry["validated_at"] < DOWNLOAD_CACHE_REVALIDATE_AFTER
+
+
+def mark_validated(path: str, entry: dict):
+    """Storage confirmed the ETag is still current."""
+    _, meta_path = _entry_paths(path)
+    _write_meta(meta_path, {**entry, "path": path, "validated_at": time.time()})
+
+
+def invalidate(path: str):
+    for file in _entry_paths(path):
+        try:
+            file.unlink()
+        except OSError:
+            pass
+
+
+def invalidate_prefix(prefix: str) -> int:
+    """Drop every cached file under a folder, e.g. a whole shop on uninstall. Returns how many."""
+    removed = 0
+    for meta_path in DOWNLOAD_CACHE_DIR.glob("*/*.json"):
+        try:
+            path = json.loads(meta_path.read_text()).get("path")
+        except (OSError, ValueError):
+            continue
+        if path and path.startswith(prefix):
+            invalidate(path)
+            removed += 1
+    if removed:
+        logger.info(f"🧹 Download cache dropped {removed} file(s) under {prefix}")
+    return removed
+
+
+def _write_meta(meta_path: Path, entry: dict):
+    meta = {k: entry[k] for k in ("path", "etag", "content_type", "size", "validated_at")}
+    tmp = meta_path.with_name(f"{meta_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, meta_path)
+    except OSError as e:
+        logger.warning(f"Download cache metadata write failed: {e}")
+        tmp.unlink(missing_ok=True)
+
+
+class CacheWriter:
+    """
+    Collects a file as it is relayed to the client. Nothing is published until commit(),
+    so an aborted or oversized transfer never leaves a partial entry behind.
+    """
+
+    def __init__(self, path: str, etag: str, content_type: str):
+        self.path = path
+        self.etag = etag
+        self.content_type = content_type
+        self.size = 0
+        self.data_path, self.meta_path = _entry_paths(path)
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.data_path.with_name(f"{self.data_path.name}.{uuid.uuid4().hex}.tmp")
+        self.file = open(self.tmp, "wb")
+
+    def write(self, chunk: bytes) -> bool:
+        """False once the file is over DOWNLOAD_CACHE_MAX_FILE_BYTES; the writer is aborted then."""
+        if self.file is None:
+            return False
+        self.size += len(chunk)
+        if self.size > DOWNLOAD_CACHE_MAX_FILE_BYTES:
+            self.abort()
+            return False
+        self.file.write(chunk)
+        return True
+
+    def commit(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        os.replace(self.tmp, self.data_path)
+        _write_meta(self.meta_path, {
+            "path": self.path,
+            "etag": self.etag,
+            "content_type": self.content_type,
+            "size": self.size,
+            "validated_at": time.time(),
+        })
+        _account(self.size)
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.tmp.unlink(missing_ok=True)
+
+
+def open_writer(path: str, etag: Optional[str], content_type: str, length: Optional[int]) -> Optional[CacheWriter]:
+    """A writer for a full response worth caching, or None (no ETag, too large, disk trouble)."""
+    if not DOWNLOAD_CACHE_ENABLED or not etag:
+        return None
+    if length is not None and length > DOWNLOAD_CACHE_MAX_FILE_BYTES:
+        return None
+    try:
+        return CacheWriter(path, etag, content_type)
+    except OSError as e:
+        logger.warning(f"Download cache unavailable: {e}")
+        return None
+
+
+def store_bytes(path: str, data: bytes, etag: str, content_type: str):
+    writer = open_writer(path, etag, content_type, len(data))
+    if writer:
+        try:
+            writer.write(data)
+            writer.commit()
+        except OSError as e:
+            writer.abort()
+            logger.warning(f"Download cache write failed for {path}: {e}")
+
+
+def prewarm(path: str, data: bytes, content_type: str):
+    """
+    Cache a just-stored result so its first download is already a hit. Storage is asked
+    for one byte to learn the ETag the API will revalidate against. Best effort.
+    """
+    if not (DOWNLOAD_CACHE_ENABLED and DOWNLOAD_CACHE_PREWARM):
+        return
+    try:
+        resp = requests.get(get_signed_url(path), headers={"Range": "bytes=0-0"}, timeout=10)
+        etag = resp.headers.get("etag")
+        if resp.ok and etag:
+            store_bytes(path, data, etag, content_type)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not pre-warm download cache for {path}: {e}")
+
+
+def _account(size: int):
+    global _approx_bytes
+    with _size_lock:
+        if _approx_bytes is None:
+            _approx_bytes = _disk_usage()
+        else:
+            _approx_bytes += size
+        if _approx_bytes > DOWNLOAD_CACHE_MAX_BYTES:
+            # Other processes write to the same directory; the scan corrects the estimate
+            _approx_bytes = _evict(int(DOWNLOAD_CACHE_MAX_BYTES * DOWNLOAD_CACHE_LOW_WATER))
+
+
+def _entries() -> list[tuple[float, int, Path]]:
+    entries = []
+    for data_path in DOWNLOAD_CACHE_DIR.glob("*/*.bin"):
+        try:
+            stat = data_path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, data_path))
+    return entries
+
+
+def _disk_usage() -> int:
+    return sum(size for _, size, _ in _entries())
+
+
+def _evict(target: int) -> int:
+    """Remove least recently used files until the cache fits in target bytes; returns the size left."""
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, data_path in entries:
+        if total <= target:
+            break
+        data_path.with_suffix(".json").unlink(missing_ok=True)
+        data_path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+
+    # Temp files of transfers cut off by a crash
+    cutoff = time.time() - 3600
+    for tmp in DOWNLOAD_CACHE_DIR.glob("*/*.tmp"):
+        try:
+            if tmp.stat().st_mtime < cutoff:
+                tmp.unlink()
+        except OSError:
+            pass
+
+    if removed:
+        logger.info(f"🧹 Download cache evicted {removed} file(s), {total / (1024 * 1024):.0f} MB kept")
+    return total
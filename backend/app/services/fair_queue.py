@@ -0,0 +1,185 @@
+# app/services/fair_queue.py
+import os
+import json
+import time
+import logging
+
+from redis.exceptions import RedisError
+
+from app.config.plans import PLANS, DEFAULT_PLAN_WEIGHT
+from app.services.redis_service import redis_client
+from app.services.supabase_service import supabase
+
+logger = logging.getLogger("fair_queue")
+
+# Per-shop FIFO of pending submissions: fairq:shop:{shop} -> JSON jobs
+FAIR_QUEUE_PREFIX = "fairq:shop:"
+# Round-robin ring of shops that have pending jobs (a shop is listed iff its queue is non-empty)
+FAIR_RING_KEY = "fairq:ring"
+# shop -> DRR deficit carried over between turns
+FAIR_DEFICITS_KEY = "fairq:deficits"
+# shop -> weight, refreshed on every enqueue
+FAIR_WEIGHTS_KEY = "fairq:weights"
+# Jobs handed to image_queue and not finished yet: member = image_id, score = expiry
+FAIR_OUTSTANDING_KEY = "fairq:outstanding"
+FAIR_WAKEUP_KEY = "fairq:wakeup"
+
+# Max jobs sitting in image_queue at once; everything else waits in its shop's queue
+FAIR_DISPATCH_WINDOW = int(os.getenv("FAIR_DISPATCH_WINDOW", "20"))
+# Jobs a weight-1 shop may send per round-robin turn
+FAIR_QUANTUM = float(os.getenv("FAIR_QUANTUM", "1"))
+# An outstanding job frees its spot after this long even if its worker died
+FAIR_OUTSTANDING_TTL = int(os.getenv("FAIR_OUTSTANDING_TTL", "900"))
+FAIR_PLAN_WEIGHTS = os.getenv("FAIR_PLAN_WEIGHTS", "true").lower() == "true"
+FAIR_WEIGHT_CACHE_TTL = 300
+
+DISPATCH_QUEUE = "polling_queue"
+
+
+# Appends a job (or puts it back at the front) and adds the shop to the ring if its queue was empty.
+LUA_ENQUEUE = r"""
+-- KEYS: 1 shop queue, 2 ring, 3 weights
+-- ARGV: 1 job, 2 shop, 3 weight, 4 front (0/1)
+local len
+if ARGV[4] == '1' then
+  len = redis.call('LPUSH', KEYS[1], ARGV[1])
+else
+  len = redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+redis.call('HSET', KEYS[3], ARGV[2], ARGV[3])
+if len == 1 then
+  redis.call('RPUSH', KEYS[2], ARGV[2])
+end
+return len
+"""
+
+# One deficit round-robin pass until the dispatch window is full or every queue is empty.
+# Each visit credits quantum * weight to the shop at the head of the ring and pops jobs
+# while the deficit covers them. If the window fills mid-turn the shop stays at the head
+# with the unspent part of its turn, so it resumes exactly where it stopped.
+LUA_DISPATCH = r"""
+-- KEYS: 1 ring, 2 deficits, 3 weights, 4 outstanding
+-- ARGV: 1 now, 2 window, 3 quantum, 4 queue prefix, 5 outstanding ttl
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now)
+local capacity = tonumber(ARGV[2]) - redis.call('ZCARD', KEYS[4])
+local out = {}
+local visits = 0
+while capacity > 0 and visits < 10000 do
+  local shop = redis.call('LINDEX', KEYS[1], 0)
+  if not shop then break end
+  visits = visits + 1
+  local qkey = ARGV[4] .. shop
+  local quota = tonumber(ARGV[3]) * (tonumber(redis.call('HGET', KEYS[3], shop)) or 1)
+  local deficit = (tonumber(redis.call('HGET', KEYS[2], shop)) or 0) + quota
+  while deficit >= 1 and capacity > 0 do
+    local job = redis.call('LPOP', qkey)
+    if not job then break end
+    redis.call('ZADD', KEYS[4], now + tonumber(ARGV[5]), cjson.decode(job)['image_id'])
+    table.insert(out, job)
+    deficit = deficit - 1
+    capacity = capacity - 1
+  end
+  if redis.call('LLEN', qkey) == 0 then
+    redis.call('LPOP', KEYS[1])
+    redis.call('HDEL', KEYS[2], shop)
+    redis.call('HDEL', KEYS[3], shop)
+  elseif deficit >= 1 then
+    -- Window full mid-turn: the next visit re-adds the quota, so store only the unspent remainder
+    redis.call('HSET', KEYS[2], shop, tostring(deficit - quota))
+  else
+    redis.call('HSET', KEYS[2], shop, tostring(deficit))
+    redis.call('RPUSH', KEYS[1], redis.call('LPOP', KEYS[1]))
+  end
+end
+return out
+"""
+
+_enqueue = redis_client.register_script(LUA_ENQUEUE)
+_dispatch = redis_client.register_script(LUA_DISPATCH)
+
+
+def shop_weight(shop: str) -> float:
+    """Round-robin weight for a shop, from its plan in config/plans.py (cached briefly)."""
+    if not FAIR_PLAN_WEIGHTS:
+        return DEFAULT_PLAN_WEIGHT
+
+    cache_key = f"fairq:plan_weight:{shop}"
+    cached = redis_client.get(cache_key)
+    if cached:
+        return float(cached)
+
+    weight = DEFAULT_PLAN_WEIGHT
+    try:
+        res = supabase.table("shops").select("plan").eq("shop", shop).maybe_single().execute()
+        plan = (getattr(res, "data", None) or {}).get("plan")
+        weight = PLANS.get(str(plan), {}).get("weight", DEFAULT_PLAN_WEIGHT)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read plan for {shop}, using default weight: {e}")
+
+    redis_client.set(cache_key, weight, ex=FAIR_WEIGHT_CACHE_TTL)
+    return weight
+
+
+def enqueue_job(job: dict, front: bool = False) -> int:
+    """Add a submission to its shop's queue. Returns the shop's queue length."""
+    shop = job["shop"]
+    return _enqueue(
+        keys=[f"{FAIR_QUEUE_PREFIX}{shop}", FAIR_RING_KEY, FAIR_WEIGHTS_KEY],
+        args=[json.dumps(job), shop, shop_weight(shop), int(front)],
+    )
+
+
+def enqueue_jobs(jobs: list[dict]) -> list[int]:
+    """Enqueue many submissions in one Redis round trip. Returns each job's queue length."""
+    weights = {shop: shop_weight(shop) for shop in {job["shop"] for job in jobs}}
+    pipe = redis_client.pipeline(transaction=False)
+    for job in jobs:
+        shop = job["shop"]
+        _enqueue(
+            keys=[f"{FAIR_QUEUE_PREFIX}{shop}", FAIR_RING_KEY, FAIR_WEIGHTS_KEY],
+            args=[json.dumps(job), shop, weights[shop], 0],
+            client=pipe,
+        )
+    return pipe.execute()
+
+
+def take_fair_batch() -> list[dict]:
+    """Pop as many jobs as the dispatch window allows, interleaved fairly across shops."""
+    jobs = _dispatch(
+        keys=[FAIR_RING_KEY, FAIR_DEFICITS_KEY, FAIR_WEIGHTS_KEY, FAIR_OUTSTANDING_KEY],
+        args=[time.time(), FAIR_DISPATCH_WINDOW, FAIR_QUANTUM, FAIR_QUEUE_PREFIX, FAIR_OUTSTANDING_TTL],
+    )
+    return [json.loads(j) for j in jobs]
+
+
+def finish_job(image_id: str):
+    """Free the job's spot in the dispatch window."""
+    try:
+        redis_client.zrem(FAIR_OUTSTANDING_KEY, image_id)
+    except RedisError as e:
+        # The spot expires on its own after FAIR_OUTSTANDING_TTL
+        logger.error(f"[FairQueue] Redis error finishing {image_id}: {e}")
+
+
+def can_dispatch() -> bool:
+    """True when jobs are waiting and the dispatch window has room."""
+    pipe = redis_client.pipeline()
+    pipe.zremrangebyscore(FAIR_OUTSTANDING_KEY, "-inf", time.time())
+    pipe.zcard(FAIR_OUTSTANDING_KEY)
+    pipe.llen(FAIR_RING_KEY)
+    _, outstanding, shops = pipe.execute()
+    return shops > 0 and outstanding < FAIR_DISPATCH_WINDOW
+
+
+def pending_count(shop: str) -> int:
+    return redis_client.llen(f"{FAIR_QUEUE_PREFIX}{shop}")
+
+
+def request_dispatch_wakeup(ttl: int = 60) -> bool:
+    """True if the caller should enqueue the dispatcher (none is pending yet)."""
+    return bool(redis_client.set(FAIR_WAKEUP_KEY, 1, nx=True, ex=ttl))
+
+
+def clear_dispatch_wakeup():
+    redis_client.delete(FAIR_WAKEUP_KEY)
@@ -0,0 +1,23 @@
+# app/services/image_sniff.py
+from typing import Optional
+
+# Enough leading bytes to tell every accepted format apart
+SNIFF_BYTES = 16
+
+# Formats accepted for upload -> (extension, mime); decided by content, never by filename or client MIME
+ACCEPTED_IMAGE_TYPES = {
+    "jpeg": ("jpg", "image/jpeg"),
+    "png": ("png", "image/png"),
+    "webp": ("webp", "image/webp"),
+}
+
+
+def sniff_image_type(head: bytes) -> Optional[tuple[str, str]]:
+    """(extension, mime) from an image's magic bytes, or None when it is not an accepted image."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ACCEPTED_IMAGE_TYPES["jpeg"]
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ACCEPTED_IMAGE_TYPES["png"]
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ACCEPTED_IMAGE_TYPES["webp"]
+    return None
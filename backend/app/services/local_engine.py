@@ -0,0 +1,142 @@
+# app/services/local_engine.py
+import io
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger("local_engine")
+
+# Operations run in-process with Pillow instead of through MakeIt3D
+LOCAL_ENGINE_OPERATIONS = {
+    op.strip() for op in os.getenv("LOCAL_ENGINE_OPERATIONS", "downscale").split(",") if op.strip()
+}
+LOCAL_ENGINE_WORKERS = int(os.getenv("LOCAL_ENGINE_WORKERS", str(os.cpu_count() or 2)))
+LOCAL_ENGINE_TIMEOUT = float(os.getenv("LOCAL_ENGINE_TIMEOUT", "60"))
+
+# output_format -> (file extension, content type)
+OUTPUT_TYPES = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "avif": (".avif", "image/avif"),
+}
+
+# Per-shop output encodings (settings.output_encoding); "original" keeps the operation's own format
+OUTPUT_ENCODINGS = ("original", "png", "webp", "avif")
+try:
+    AVIF_AVAILABLE = bool(features.check("avif"))
+except Exception:
+    AVIF_AVAILABLE = False
+
+JPEG_START_QUALITY = 90
+JPEG_MIN_QUALITY = 60
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def output_type(output_format: str) -> tuple[str, str]:
+    return OUTPUT_TYPES.get(output_format.lower(), OUTPUT_TYPES["png"])
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """JPEG has no alpha: composite transparent images onto white."""
+    if img.mode in ("RGB", "L"):
+        return img
+    rgba = img.convert("RGBA")
+    background = Image.new("RGB", rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.split()[-1])
+    return background
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(buf, fmt, quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def downscale(data: bytes, max_size_mb: float = 2.0, aspect_ratio_mode: str = "original", output_format: str = "jpeg") -> bytes:
+    """
+    Re-encode an image to fit within max_size_mb: first by lowering quality,
+    then by shrinking its dimensions with the aspect ratio preserved.
+    """
+    if aspect_ratio_mode != "original":
+        raise ValueError(f"Unsupported aspect_ratio_mode: {aspect_ratio_mode}")
+    fmt = "JPEG" if output_format.lower() in ("jpeg", "jpg") else output_format.upper()
+    limit = int(max_size_mb * 1024 * 1024)
+
+    with Image.open(io.BytesIO(data)) as source:
+        img = ImageOps.exif_transpose(source)
+        if fmt == "JPEG":
+            img = _flatten(img)
+
+        quality = JPEG_START_QUALITY
+        while True:
+            out = _encode(img, fmt, quality)
+            if len(out) <= limit or img.width * img.height <= 1:
+                return out
+            if quality > JPEG_MIN_QUALITY:
+                quality -= 10
+                continue
+            # Encoded size scales roughly with pixel count
+            scale = max(0.1, (limit / len(out)) ** 0.5 * 0.95)
+            img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+
+
+def encode_output(data: bytes, encoding: str, quality: int = 85) -> tuple[bytes, str]:
+    """
+    Re-encode a result as webp, avif or quantized png (quality maps to palette size).
+    Returns (bytes, format actually used); AVIF falls back to WebP when Pillow lacks it.
+    """
+    if encoding == "avif" and not AVIF_AVAILABLE:
+        encoding = "webp"
+
+    with Image.open(io.BytesIO(data)) as source:
+        img = ImageOps.exif_transpose(source)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        buf = io.BytesIO()
+        if encoding == "webp":
+            img.save(buf, "WEBP", quality=quality, method=6)
+        elif encoding == "avif":
+            img.save(buf, "AVIF", quality=quality)
+        elif encoding == "png":
+            colors = min(256, max(16, round(256 * quality / 100)))
+            method = Image.Quantize.FASTOCTREE if img.mode == "RGBA" else Image.Quantize.MEDIANCUT
+            img.quantize(colors=colors, method=method).save(buf, "PNG", optimize=True)
+        else:
+            raise ValueError(f"Unsupported output encoding: {encoding}")
+    return buf.getvalue(), encoding
+
+
+LOCAL_HANDLERS = {
+    "downscale": downscale,
+}
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=LOCAL_ENGINE_WORKERS)
+    return _pool
+
+
+def run_in_pool(fn: Callable, *args, **kwargs):
+    """
+    Run CPU-bound image work in the process pool. Celery's prefork children are
+    daemonic and may not spawn processes; they already run one job per CPU, so
+    they run it inline instead.
+    """
+    if multiprocessing.current_process().daemon:
+        return fn(*args, **kwargs)
+    return _executor().submit(fn, *args, **kwargs).result(timeout=LOCAL_ENGINE_TIMEOUT)
+
+
+def run_local(operation: str, data: bytes, params: dict) -> bytes:
+    return run_in_pool(LOCAL_HANDLERS[operation], data, **params)
@@ -0,0 +1,283 @@
+# app/services/makeit3d_client.py
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from redis.exceptions import RedisError
+
+from app.services.redis_service import redis_client
+
+logger = logging.getLogger("makeit3d_client")
+
+MAKEIT3D_API_KEY = os.getenv("MAKEIT3D_API_KEY")
+MAKEIT3D_BASE_URL = "https://api.makeit3d.io"
+
+HEADERS = {
+    "X-API-Key": MAKEIT3D_API_KEY,
+    "Content-Type": "application/json",
+}
+
+# Per-call deadlines (seconds) cover every attempt, including backoff sleeps
+SUBMIT_DEADLINE = float(os.getenv("MAKEIT3D_SUBMIT_DEADLINE", "30"))
+STATUS_DEADLINE = float(os.getenv("MAKEIT3D_STATUS_DEADLINE", "10"))
+CONNECT_TIMEOUT = 5.0
+MAX_ATTEMPTS = int(os.getenv("MAKEIT3D_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 5.0
+POOL_SIZE = int(os.getenv("MAKEIT3D_POOL_SIZE", "50"))
+
+# Retry budget: retries may add at most this fraction on top of first attempts
+RETRY_BUDGET_RATIO = float(os.getenv("MAKEIT3D_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_PER_SEC = float(os.getenv("MAKEIT3D_RETRY_BUDGET_MIN_PER_SEC", "1"))
+
+# Circuit breaker, shared by every worker through Redis
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("MAKEIT3D_BREAKER_FAILURES", "10"))
+BREAKER_WINDOW_S = int(os.getenv("MAKEIT3D_BREAKER_WINDOW", "30"))
+BREAKER_OPEN_S = int(os.getenv("MAKEIT3D_BREAKER_OPEN", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class MakeIt3DError(Exception):
+    def __init__(self, message: str, overload: bool = False):
+        super().__init__(message)
+        # True for timeouts, connection errors, 429 and 5xx: signs the provider is saturated
+        self.overload = overload
+
+
+class CircuitOpenError(MakeIt3DError):
+    """The provider is considered down; the call was not attempted."""
+
+    def __init__(self, message: str):
+        super().__init__(message, overload=True)
+
+
+class RetryBudget:
+    """
+    Token bucket shared by every call in the process. Each first attempt deposits
+    RETRY_BUDGET_RATIO tokens, each retry withdraws one, so retries cannot
+    multiply load on a struggling provider.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_sec: float = RETRY_BUDGET_MIN_PER_SEC):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.cap = max(10.0, min_per_sec * 10)
+        self.tokens = self.cap
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.cap, self.tokens + (now - self.updated) * self.min_per_sec)
+        self.updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    Closed → open after BREAKER_FAILURE_THRESHOLD failures within BREAKER_WINDOW_S.
+    While open every call fails fast; after BREAKER_OPEN_S one probe is let through
+    (half-open) and its outcome closes or re-opens the circuit. Redis errors never
+    block calls.
+    """
+
+    def __init__(self, name: str = "makeit3d"):
+        self.failures_key = f"cb:{name}:failures"
+        self.open_key = f"cb:{name}:open_until"
+        self.probe_key = f"cb:{name}:probe"
+
+    def allow(self) -> bool:
+        try:
+            open_until = redis_client.get(self.open_key)
+            if not open_until:
+                return True
+            if time.time() < float(open_until):
+                return False
+            # Half-open: a single caller probes the provider
+            return bool(redis_client.set(self.probe_key, 1, nx=True, ex=BREAKER_OPEN_S))
+        except RedisError:
+            return True
+
+    def record_success(self):
+        try:
+            pipe = redis_client.pipeline()
+            pipe.delete(self.open_key)
+            pipe.delete(self.failures_key, self.probe_key)
+            was_open, _ = pipe.execute()
+            if was_open:
+                logger.info("🟢 MakeIt3D circuit closed")
+        except RedisError:
+            pass
+
+    def record_failure(self):
+        try:
+            failures = redis_client.incr(self.failures_key)
+            if failures == 1:
+                redis_client.expire(self.failures_key, BREAKER_WINDOW_S)
+            half_open = redis_client.exists(self.probe_key)
+            if failures >= BREAKER_FAILURE_THRESHOLD or half_open:
+                redis_client.set(self.open_key, time.time() + BREAKER_OPEN_S, ex=BREAKER_OPEN_S * 4)
+                redis_client.delete(self.failures_key, self.probe_key)
+                logger.warning(f"🔴 MakeIt3D circuit open for {BREAKER_OPEN_S}s ({failures} recent failures)")
+        except RedisError:
+            pass
+
+
+retry_budget = RetryBudget()
+breaker = CircuitBreaker()
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def _is_failure(status_code: Optional[int]) -> bool:
+    return status_code is None or status_code in RETRYABLE_STATUS
+
+
+def _raise_for_response(op: str, status_code: int, body: str):
+    if status_code >= 400:
+        raise MakeIt3DError(f"MakeIt3D {op} failed: HTTP {status_code} {body[:200]}", overload=status_code in RETRYABLE_STATUS)
+
+
+def _log_call(op: str, attempt: int, status_code: Optional[int], started: float, error: Exception = None):
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    outcome = status_code if status_code is not None else type(error).__name__
+    log = logger.warning if _is_failure(status_code) else logger.debug
+    log(f"[MakeIt3D] {op} attempt={attempt + 1} outcome={outcome} latency_ms={elapsed_ms}")
+
+
+class MakeIt3DClient:
+    """Synchronous pooled client used by Celery tasks."""
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(HEADERS)
+
+    def _call(self, op: str, method: str, path: str, deadline_s: float, retry_on_timeout: bool, **kwargs) -> dict:
+        if not breaker.allow():
+            raise CircuitOpenError("MakeIt3D circuit is open, failing fast")
+
+        deadline = time.monotonic() + deadline_s
+        retry_budget.deposit()
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            started = time.monotonic()
+            status_code, error = None, None
+            try:
+                res = self.session.request(
+                    method,
+                    f"{MAKEIT3D_BASE_URL}{path}",
+                    timeout=(min(CONNECT_TIMEOUT, remaining), remaining),
+                    **kwargs,
+                )
+                status_code = res.status_code
+            except requests.ConnectionError as e:
+                error = e
+            except requests.Timeout as e:
+                error = e
+            _log_call(op, attempt, status_code, started, error)
+
+            if not _is_failure(status_code):
+                breaker.record_success()
+                _raise_for_response(op, status_code, res.text)
+                return res.json()
+
+            breaker.record_failure()
+            # A POST that timed out may have been accepted; only retry it when that is safe
+            retryable = status_code is not None or isinstance(error, requests.ConnectionError) or retry_on_timeout
+            delay = _backoff(attempt)
+            attempt += 1
+            if (
+                not retryable
+                or attempt >= MAX_ATTEMPTS
+                or time.monotonic() + delay >= deadline
+                or not retry_budget.try_withdraw()
+            ):
+                if error:
+                    raise MakeIt3DError(f"MakeIt3D {op} failed: {error}", overload=True)
+                _raise_for_response(op, status_code, res.text)
+            time.sleep(delay)
+
+    def submit(self, endpoint: str, payload: dict) -> dict:
+        return self._call("submit", "POST", endpoint, SUBMIT_DEADLINE, retry_on_timeout=False, json=payload)
+
+    def get_task_status(self, task_id: str) -> dict:
+        return self._call("status", "GET", f"/tasks/{task_id}/status", STATUS_DEADLINE, retry_on_timeout=True)
+
+
+class AsyncMakeIt3DClient:
+    """Async pooled client for the status poller; shares the breaker and retry budget."""
+
+    def __init__(self, max_connections: int = POOL_SIZE):
+        self.client = httpx.AsyncClient(
+            base_url=MAKEIT3D_BASE_URL,
+            headers=HEADERS,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def get_task_status(self, task_id: str) -> dict:
+        op = "status"
+        # Breaker state lives in Redis; keep the event loop free while checking it
+        if not await asyncio.to_thread(breaker.allow):
+            raise CircuitOpenError("MakeIt3D circuit is open, failing fast")
+
+        deadline = time.monotonic() + STATUS_DEADLINE
+        retry_budget.deposit()
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            started = time.monotonic()
+            status_code, error = None, None
+            try:
+                res = await self.client.get(
+                    f"/tasks/{task_id}/status",
+                    timeout=httpx.Timeout(remaining, connect=min(CONNECT_TIMEOUT, remaining)),
+                )
+                status_code = res.status_code
+            except httpx.TransportError as e:
+                error = e
+            _log_call(op, attempt, status_code, started, error)
+
+            if not _is_failure(status_code):
+                await asyncio.to_thread(breaker.record_success)
+                _raise_for_response(op, status_code, res.text)
+                return res.json()
+
+            await asyncio.to_thread(breaker.record_failure)
+            delay = _backoff(attempt)
+            attempt += 1
+            if attempt >= MAX_ATTEMPTS or time.monotonic() + delay >= deadline or not retry_budget.try_withdraw():
+                if error:
+                    raise MakeIt3DError(f"MakeIt3D {op} failed: {error}", overload=True)
+                _raise_for_response(op, status_code, res.text)
+            await asyncio.sleep(delay)
+
+
+makeit3d_client = MakeIt3DClient()
@@ -0,0 +1,158 @@
+# app/services/poll_scheduler.py
+import os
+import json
+import time
+import random
+import logging
+from typing import Optional
+
+from app.services.redis_service import redis_client
+
+logger = logging.getLogger("poll_scheduler")
+
+# Delayed set of MakeIt3D tasks: member = task_id, score = next check (epoch seconds)
+POLL_SCHEDULE_KEY = "poll:schedule"
+# task_id -> JSON job metadata (image_id, shop, attempt, and pipeline/stage for chained jobs)
+POLL_JOBS_KEY = "poll:jobs"
+
+POLL_BASE_DELAY = float(os.getenv("POLL_BASE_DELAY", "5"))
+POLL_MAX_DELAY = float(os.getenv("POLL_MAX_DELAY", "120"))
+POLL_MAX_ATTEMPTS = int(os.getenv("POLL_MAX_ATTEMPTS", "3"))
+# A claimed job becomes due again after this long, so a crashed poller never loses it
+POLL_CLAIM_TIMEOUT = int(os.getenv("POLL_CLAIM_TIMEOUT", "120"))
+
+# How long a task stays marked as finalized, so late callbacks/polls are ignored
+POLL_DONE_TTL = int(os.getenv("POLL_DONE_TTL", str(60 * 60 * 24)))
+
+POLL_QUEUE = "polling_queue"
+# Epoch seconds at which the next poller run is already enqueued
+POLL_WAKEUP_KEY = f"poll:wakeup:{POLL_QUEUE}"
+
+
+# Atomically pops up to N due jobs by pushing their score out by the claim timeout.
+LUA_CLAIM_DUE = r"""
+-- KEYS: 1 schedule (ZSET), 2 jobs (HASH)
+-- ARGV: 1 now, 2 limit, 3 claim_timeout
+local now = tonumber(ARGV[1])
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, tonumber(ARGV[2]))
+local out = {}
+for _, task_id in ipairs(due) do
+  local meta = redis.call('HGET', KEYS[2], task_id)
+  if meta then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), task_id)
+    table.insert(out, meta)
+  else
+    redis.call('ZREM', KEYS[1], task_id)
+  end
+end
+return out
+"""
+
+# Records a wake-up only if none is pending at or before the requested time.
+# A pending time already in the past may be a run that found the lease busy, so it never coalesces.
+LUA_REQUEST_WAKEUP = r"""
+-- KEYS: 1 wakeup key
+-- ARGV: 1 now, 2 wake_at, 3 ttl_ms
+local now = tonumber(ARGV[1])
+local wake_at = tonumber(ARGV[2])
+local pending = tonumber(redis.call('GET', KEYS[1]))
+if pending and pending >= now and pending <= wake_at then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'PX', tonumber(ARGV[3]))
+return 1
+"""
+
+_claim_due = redis_client.register_script(LUA_CLAIM_DUE)
+_request_wakeup = redis_client.register_script(LUA_REQUEST_WAKEUP)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with equal jitter, capped at POLL_MAX_DELAY."""
+    ceiling = min(POLL_MAX_DELAY, POLL_BASE_DELAY * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def schedule_poll(
+    task_id: str,
+    image_id: str,
+    shop: str,
+    attempt: int = 0,
+    delay: Optional[float] = None,
+    pipeline: Optional[list[str]] = None,
+    stage: int = 0,
+) -> float:
+    """
+    Schedule the next status check for one MakeIt3D task. Returns the delay in seconds.
+    For chained jobs, `pipeline` is the full list of operations and `stage` the index this task runs.
+    """
+    if delay is None:
+        delay = backoff_delay(attempt)
+    job = {"task_id": task_id, "image_id": image_id, "shop": shop, "attempt": attempt}
+    if pipeline:
+        job.update({"pipeline": pipeline, "stage": stage})
+
+    pipe = redis_client.pipeline()
+    pipe.hset(POLL_JOBS_KEY, task_id, json.dumps(job))
+    pipe.zadd(POLL_SCHEDULE_KEY, {task_id: time.time() + delay})
+    pipe.execute()
+    return delay
+
+
+def claim_due_polls(limit: int = 50) -> list[dict]:
+    """Claim up to `limit` jobs whose next check time has passed."""
+    raw = _claim_due(keys=[POLL_SCHEDULE_KEY, POLL_JOBS_KEY], args=[time.time(), limit, POLL_CLAIM_TIMEOUT])
+    return [json.loads(item) for item in raw]
+
+
+def complete_poll(task_id: str):
+    """Stop polling a task (completed, failed or given up)."""
+    pipe = redis_client.pipeline()
+    pipe.zrem(POLL_SCHEDULE_KEY, task_id)
+    pipe.hdel(POLL_JOBS_KEY, task_id)
+    pipe.execute()
+
+
+def get_poll_job(task_id: str) -> Optional[dict]:
+    raw = redis_client.hget(POLL_JOBS_KEY, task_id)
+    return json.loads(raw) if raw else None
+
+
+def claim_task_completion(task_id: str) -> bool:
+    """
+    First caller wins the right to finalize a task. Callbacks and the polling
+    safety net can both see the same completion; only one may store the result.
+    """
+    return bool(redis_client.set(f"poll:done:{task_id}", 1, nx=True, ex=POLL_DONE_TTL))
+
+
+def release_task_completion(task_id: str):
+    """Undo a claim when finalizing failed, so a later poll or callback can retry."""
+    redis_client.delete(f"poll:done:{task_id}")
+
+
+def is_poll_scheduled(task_id: str) -> bool:
+    return redis_client.zscore(POLL_SCHEDULE_KEY, task_id) is not None
+
+
+def next_poll_delay() -> Optional[float]:
+    """Seconds until the earliest scheduled check, or None when nothing is in flight."""
+    head = redis_client.zrange(POLL_SCHEDULE_KEY, 0, 0, withscores=True)
+    if not head:
+        return None
+    _, due_at = head[0]
+    return max(0.0, due_at - time.time())
+
+
+def request_poll_wakeup(delay: float) -> bool:
+    """
+    Coalesce poller wake-ups. Returns True when the caller should enqueue a poller
+    run in `delay` seconds, False when one is already due no later than that.
+    """
+    now = time.time()
+    ttl_ms = int((delay + POLL_CLAIM_TIMEOUT) * 1000)
+    return bool(_request_wakeup(keys=[POLL_WAKEUP_KEY], args=[now, now + delay, ttl_ms]))
+
+
+def clear_poll_wakeup():
+    redis_client.delete(POLL_WAKEUP_KEY)
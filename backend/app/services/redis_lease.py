@@ -0,0 +1,51 @@
+# app/services/redis_lease.py
+import uuid
+import logging
+
+from app.services.redis_service import redis_client
+
+logger = logging.getLogger("redis_lease")
+
+# Extend/release only when we still hold the lease (token matches)
+LUA_EXTEND = r"""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+LUA_RELEASE = r"""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_extend = redis_client.register_script(LUA_EXTEND)
+_release = redis_client.register_script(LUA_RELEASE)
+
+
+class RedisLease:
+    """
+    Token-guarded lease in Redis. Expires on its own if the holder dies;
+    the holder keeps it alive with heartbeat() while it works.
+    """
+
+    def __init__(self, name: str, ttl_ms: int = 60_000):
+        self.key = f"lease:{name}"
+        self.ttl_ms = ttl_ms
+        self.token = uuid.uuid4().hex
+
+    def acquire(self) -> bool:
+        return bool(redis_client.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    def heartbeat(self) -> bool:
+        """Extend the lease. Returns False if it was lost to another holder."""
+        return bool(_extend(keys=[self.key], args=[self.token, self.ttl_ms]))
+
+    def release(self):
+        try:
+            _release(keys=[self.key], args=[self.token])
+        except Exception as e:
+            # It will expire on its own
+            logger.warning(f"Lease release failed for {self.key}: {e}")
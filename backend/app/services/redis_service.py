@@ -0,0 +1,11 @@
+import os
+import redis
+import redis.asyncio
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Shared synchronous client for Celery workers and sync helpers
+redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+# Asyncio client for request handlers, so cache lookups never block the event loop
+async_redis_client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
@@ -0,0 +1,105 @@
+# app/services/result_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Optional
+
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+from app.config.operations import OPERATIONS
+from app.services.redis_service import redis_client
+
+logger = logging.getLogger("result_cache")
+
+# rcache:entry:{key} -> JSON {processed_path, stored_at}
+RESULT_CACHE_ENTRY_PREFIX = "rcache:entry:"
+# LRU index: member = key, score = last use (epoch seconds)
+RESULT_CACHE_LRU_KEY = "rcache:lru"
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(60 * 60 * 24 * 30)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "100000"))
+
+cache_lookups = Counter(
+    "result_cache_lookups_total",
+    "Processed-result cache lookups by outcome (hit, miss, stale)",
+    ["outcome"],
+)
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_operation(stages: list[str]) -> str:
+    """Cache name for a job: the operation, or "remove-bg>upscale" for a chained job."""
+    return ">".join(stages)
+
+
+def cache_key(input_sha256: str, operation: str, variant: str = "original") -> str:
+    """
+    Identity of a result: input bytes + operation(s) + the exact params sent to MakeIt3D
+    + the output encoding it was stored in (see shop_settings.output_variant).
+    """
+    stage_params = [OPERATIONS.get(op, {}).get("params", {}) for op in operation.split(">")]
+    params = json.dumps(stage_params[0] if len(stage_params) == 1 else stage_params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{input_sha256}:{operation}:{params}:{variant}".encode("utf-8")).hexdigest()
+
+
+def lookup(input_sha256: str, operation: str, variant: str = "original") -> Optional[str]:
+    """Return the processed_path of an earlier identical job, refreshing its LRU/TTL."""
+    if not RESULT_CACHE_ENABLED or not input_sha256:
+        return None
+    key = cache_key(input_sha256, operation, variant)
+    try:
+        raw = redis_client.get(f"{RESULT_CACHE_ENTRY_PREFIX}{key}")
+        if not raw:
+            redis_client.zrem(RESULT_CACHE_LRU_KEY, key)
+            cache_lookups.labels("miss").inc()
+            return None
+        pipe = redis_client.pipeline()
+        pipe.expire(f"{RESULT_CACHE_ENTRY_PREFIX}{key}", RESULT_CACHE_TTL)
+        pipe.zadd(RESULT_CACHE_LRU_KEY, {key: time.time()})
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"[ResultCache] Redis error on lookup: {e}")
+        return None
+
+    cache_lookups.labels("hit").inc()
+    return json.loads(raw)["processed_path"]
+
+
+def store(input_sha256: str, operation: str, processed_path: str, variant: str = "original"):
+    """Remember a finished result and evict the least recently used entries past the cap."""
+    if not RESULT_CACHE_ENABLED or not input_sha256:
+        return
+    key = cache_key(input_sha256, operation, variant)
+    entry = json.dumps({"processed_path": processed_path, "stored_at": int(time.time())})
+    try:
+        pipe = redis_client.pipeline()
+        pipe.set(f"{RESULT_CACHE_ENTRY_PREFIX}{key}", entry, ex=RESULT_CACHE_TTL)
+        pipe.zadd(RESULT_CACHE_LRU_KEY, {key: time.time()})
+        pipe.zcard(RESULT_CACHE_LRU_KEY)
+        size = pipe.execute()[-1]
+
+        overflow = size - RESULT_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted = [k for k, _ in redis_client.zpopmin(RESULT_CACHE_LRU_KEY, overflow)]
+            redis_client.delete(*(f"{RESULT_CACHE_ENTRY_PREFIX}{k}" for k in evicted))
+            logger.info(f"[ResultCache] Evicted {len(evicted)} least recently used entries")
+    except RedisError as e:
+        logger.error(f"[ResultCache] Redis error on store: {e}")
+
+
+def invalidate(input_sha256: str, operation: str, variant: str = "original"):
+    """Drop an entry whose stored output is gone (e.g. the shop that owned it uninstalled)."""
+    key = cache_key(input_sha256, operation, variant)
+    try:
+        redis_client.delete(f"{RESULT_CACHE_ENTRY_PREFIX}{key}")
+        redis_client.zrem(RESULT_CACHE_LRU_KEY, key)
+    except RedisError as e:
+        logger.error(f"[ResultCache] Redis error on invalidate: {e}")
+    cache_lookups.labels("stale").inc()
@@ -0,0 +1,60 @@
+# app/services/shop_settings.py
+import json
+import logging
+
+from redis.exceptions import RedisError
+
+from app.services.redis_service import redis_client
+from app.services.supabase_service import supabase
+
+logger = logging.getLogger("shop_settings")
+
+SHOP_SETTINGS_CACHE_TTL = 300
+DEFAULT_OUTPUT_QUALITY = 85
+
+
+def _cache_key(shop: str) -> str:
+    return f"settings:output:{shop}"
+
+
+def get_output_encoding(shop: str) -> tuple[str, int]:
+    """(encoding, quality) for a shop's processed images; ("original", ...) when optimizing is off."""
+    try:
+        cached = redis_client.get(_cache_key(shop))
+        if cached:
+            encoding, quality = json.loads(cached)
+            return encoding, quality
+    except RedisError as e:
+        logger.warning(f"⚠️ Redis error reading settings cache for {shop}: {e}")
+
+    encoding, quality = "original", DEFAULT_OUTPUT_QUALITY
+    try:
+        res = supabase.table("settings") \
+            .select("optimize_images, output_encoding, output_quality") \
+            .eq("shop", shop) \
+            .limit(1) \
+            .execute()
+        if res.data and res.data[0].get("optimize_images"):
+            encoding = res.data[0].get("output_encoding") or "original"
+            quality = res.data[0].get("output_quality") or DEFAULT_OUTPUT_QUALITY
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read output settings for {shop}, keeping original format: {e}")
+        return encoding, quality
+
+    try:
+        redis_client.set(_cache_key(shop), json.dumps([encoding, quality]), ex=SHOP_SETTINGS_CACHE_TTL)
+    except RedisError:
+        pass
+    return encoding, quality
+
+
+def output_variant(encoding: str, quality: int) -> str:
+    """Result cache variant for an encoding: outputs stored differently are different results."""
+    return encoding if encoding == "original" else f"{encoding}:{quality}"
+
+
+def invalidate_shop_settings(shop: str):
+    try:
+        redis_client.delete(_cache_key(shop))
+    except RedisError as e:
+        logger.warning(f"⚠️ Redis error invalidating settings cache for {shop}: {e}")
@@ -1,20 +1,264 @@
 from fastapi import HTTPException
 from app.services.supabase_service import supabase
+from app.services.async_supabase import create_signed_url, create_signed_urls
+from app.services.redis_service import redis_client, async_redis_client
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+from collections import OrderedDict
+from typing import Iterable, Optional
+import threading
+import asyncio
 import logging
+import json
+import time
+import os
 
 logger = logging.getLogger("signed_url_util")
 BUCKET_NAME = "makeit3d-public"
 
-def get_signed_url(path: str, expires_in: int = 60 * 60 * 24 * 7) -> str:
+# Signed URLs are cached in two tiers: a per-process LRU in front of Redis.
+# Redis: surl:{bucket}:{path} -> hash {expires_in: {"url", "fresh_until"}}
+SIGNED_URL_CACHE_PREFIX = "surl:"
+SIGNED_URL_CACHE_ENABLED = os.getenv("SIGNED_URL_CACHE_ENABLED", "true").lower() == "true"
+# A cached URL is handed out for at most this long, and never past half of its own lifetime,
+# so every URL served still has most of its validity left
+SIGNED_URL_CACHE_MAX_TTL = int(os.getenv("SIGNED_URL_CACHE_MAX_TTL", str(60 * 60 * 24)))
+SIGNED_URL_CACHE_FRACTION = 0.5
+SIGNED_URL_LRU_SIZE = int(os.getenv("SIGNED_URL_LRU_SIZE", "10000"))
+# Bounds how long another process can serve a URL for an object deleted elsewhere
+SIGNED_URL_LRU_TTL = int(os.getenv("SIGNED_URL_LRU_TTL", "300"))
+# Paths per bulk signing request
+SIGNED_URL_BATCH_SIZE = int(os.getenv("SIGNED_URL_BATCH_SIZE", "100"))
+
+signed_url_lookups = Counter(
+    "signed_url_cache_lookups_total",
+    "Signed URL cache lookups by tier (memory, redis) and outcome (hit, miss)",
+    ["tier", "outcome"],
+)
+
+# (bucket, path, expires_in) -> (url, fresh_until)
+_lru: "OrderedDict[tuple, tuple[str, float]]" = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def _fresh_for(expires_in: int) -> int:
+    return min(SIGNED_URL_CACHE_MAX_TTL, int(expires_in * SIGNED_URL_CACHE_FRACTION))
+
+
+def _redis_key(bucket: str, path: str) -> str:
+    return f"{SIGNED_URL_CACHE_PREFIX}{bucket}:{path}"
+
+
+def _lru_get(key: tuple) -> Optional[str]:
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry and entry[1] > time.time():
+            _lru.move_to_end(key)
+            signed_url_lookups.labels("memory", "hit").inc()
+            return entry[0]
+        if entry:
+            del _lru[key]
+    signed_url_lookups.labels("memory", "miss").inc()
+    return None
+
+
+def _lru_put(key: tuple, url: str, fresh_until: float):
+    with _lru_lock:
+        _lru[key] = (url, min(fresh_until, time.time() + SIGNED_URL_LRU_TTL))
+        _lru.move_to_end(key)
+        while len(_lru) > SIGNED_URL_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _lru_drop(bucket: str, paths: Iterable[str] = (), prefix: Optional[str] = None):
+    paths = set(paths)
+    with _lru_lock:
+        for key in [k for k in _lru if k[0] == bucket and (k[1] in paths or (prefix and k[1].startswith(prefix)))]:
+            del _lru[key]
+
+
+def _from_redis(key: tuple, raw: Optional[str]) -> Optional[str]:
+    """URL from a Redis hash field if still fresh; promotes it into the LRU."""
+    entry = json.loads(raw) if raw else None
+    if not entry or entry["fresh_until"] <= time.time():
+        signed_url_lookups.labels("redis", "miss").inc()
+        return None
+    signed_url_lookups.labels("redis", "hit").inc()
+    _lru_put(key, entry["url"], entry["fresh_until"])
+    return entry["url"]
+
+
+def _entry(url: str, expires_in: int) -> tuple[str, float]:
+    fresh_until = time.time() + _fresh_for(expires_in)
+    return json.dumps({"url": url, "fresh_until": fresh_until}), fresh_until
+
+
+def get_signed_url(path: str, expires_in: int = 60 * 60 * 24 * 7, bucket: str = BUCKET_NAME) -> str:
+    key = (bucket, path, expires_in)
+    if SIGNED_URL_CACHE_ENABLED:
+        url = _lru_get(key)
+        if url:
+            return url
+        try:
+            url = _from_redis(key, redis_client.hget(_redis_key(bucket, path), str(expires_in)))
+            if url:
+                return url
+        except RedisError as e:
+            logger.warning(f"Signed URL cache read failed: {e}")
+
     try:
-        result = supabase.storage.from_(BUCKET_NAME).create_signed_url(
+        result = supabase.storage.from_(bucket).create_signed_url(
             path=path,
             expires_in=expires_in
         )
         signed_url = result.get("signedURL") or result.get("signed_url")
         if not signed_url:
             raise Exception("No signed URL in response")
-        return signed_url
     except Exception as e:
         logger.warning(f"Signed URL error: {e}")
         raise HTTPException(status_code=500, detail=f"Signed URL error: {str(e)}")
+
+    if SIGNED_URL_CACHE_ENABLED:
+        raw, fresh_until = _entry(signed_url, expires_in)
+        _lru_put(key, signed_url, fresh_until)
+        try:
+            pipe = redis_client.pipeline()
+            pipe.hset(_redis_key(bucket, path), str(expires_in), raw)
+            pipe.expire(_redis_key(bucket, path), _fresh_for(expires_in))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Signed URL cache write failed: {e}")
+    return signed_url
+
+
+async def get_signed_url_async(path: str, expires_in: int = 60 * 60 * 24 * 7, bucket: str = BUCKET_NAME) -> str:
+    """get_signed_url for request handlers: same cache and URL, without blocking the event loop."""
+    key = (bucket, path, expires_in)
+    if SIGNED_URL_CACHE_ENABLED:
+        url = _lru_get(key)
+        if url:
+            return url
+        try:
+            url = _from_redis(key, await async_redis_client.hget(_redis_key(bucket, path), str(expires_in)))
+            if url:
+                return url
+        except RedisError as e:
+            logger.warning(f"Signed URL cache read failed: {e}")
+
+    try:
+        signed_url = await create_signed_url(bucket, path, expires_in)
+    except Exception as e:
+        logger.warning(f"Signed URL error: {e}")
+        raise HTTPException(status_code=500, detail=f"Signed URL error: {str(e)}")
+
+    if SIGNED_URL_CACHE_ENABLED:
+        raw, fresh_until = _entry(signed_url, expires_in)
+        _lru_put(key, signed_url, fresh_until)
+        try:
+            pipe = async_redis_client.pipeline()
+            pipe.hset(_redis_key(bucket, path), str(expires_in), raw)
+            pipe.expire(_redis_key(bucket, path), _fresh_for(expires_in))
+            await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Signed URL cache write failed: {e}")
+    return signed_url
+
+
+async def get_signed_urls_async(
+    paths: Iterable[str],
+    expires_in: int = 60 * 60 * 24 * 7,
+    bucket: str = BUCKET_NAME,
+) -> dict[str, Optional[str]]:
+    """
+    Signed URLs for a whole list (e.g. one page of images): cache hits from the LRU and one
+    Redis round trip, the rest signed in bulk, SIGNED_URL_BATCH_SIZE paths per storage request.
+    Never raises; paths that could not be signed map to None.
+    """
+    paths = list(dict.fromkeys(p for p in paths if p))
+    urls: dict[str, Optional[str]] = {}
+    missing = []
+
+    if SIGNED_URL_CACHE_ENABLED:
+        for path in paths:
+            url = _lru_get((bucket, path, expires_in))
+            if url:
+                urls[path] = url
+            else:
+                missing.append(path)
+        if missing:
+            try:
+                pipe = async_redis_client.pipeline()
+                for path in missing:
+                    pipe.hget(_redis_key(bucket, path), str(expires_in))
+                raws = await pipe.execute()
+                for path, raw in zip(list(missing), raws):
+                    url = _from_redis((bucket, path, expires_in), raw)
+                    if url:
+                        urls[path] = url
+                missing = [p for p in missing if p not in urls]
+            except RedisError as e:
+                logger.warning(f"Signed URL cache read failed: {e}")
+    else:
+        missing = paths
+
+    if not missing:
+        return urls
+
+    async def sign_chunk(chunk: list[str]) -> dict[str, Optional[str]]:
+        try:
+            return await create_signed_urls(bucket, chunk, expires_in)
+        except Exception as e:
+            logger.warning(f"Bulk signed URL error for {len(chunk)} path(s): {e}")
+            return {path: None for path in chunk}
+
+    chunks = [missing[i:i + SIGNED_URL_BATCH_SIZE] for i in range(0, len(missing), SIGNED_URL_BATCH_SIZE)]
+    signed: dict[str, Optional[str]] = {}
+    for result in await asyncio.gather(*(sign_chunk(c) for c in chunks)):
+        signed.update(result)
+    urls.update(signed)
+
+    fresh = {path: url for path, url in signed.items() if url}
+    if SIGNED_URL_CACHE_ENABLED and fresh:
+        try:
+            pipe = async_redis_client.pipeline()
+            for path, url in fresh.items():
+                raw, fresh_until = _entry(url, expires_in)
+                _lru_put((bucket, path, expires_in), url, fresh_until)
+                pipe.hset(_redis_key(bucket, path), str(expires_in), raw)
+                pipe.expire(_redis_key(bucket, path), _fresh_for(expires_in))
+            await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Signed URL cache write failed: {e}")
+    return urls
+
+
+def invalidate_signed_urls(paths: Iterable[str], bucket: str = BUCKET_NAME):
+    """Forget cached URLs for deleted or replaced objects (every expiry at once)."""
+    paths = list(paths)
+    _lru_drop(bucket, paths)
+    if paths:
+        try:
+            redis_client.delete(*(_redis_key(bucket, p) for p in paths))
+        except RedisError as e:
+            logger.warning(f"Signed URL cache invalidation failed: {e}")
+
+
+async def invalidate_signed_urls_async(paths: Iterable[str], bucket: str = BUCKET_NAME):
+    paths = list(paths)
+    _lru_drop(bucket, paths)
+    if paths:
+        try:
+            await async_redis_client.delete(*(_redis_key(bucket, p) for p in paths))
+        except RedisError as e:
+            logger.warning(f"Signed URL cache invalidation failed: {e}")
+
+
+async def invalidate_signed_url_prefix_async(prefix: str, bucket: str = BUCKET_NAME):
+    """Forget every cached URL under a folder, e.g. a whole shop on uninstall."""
+    _lru_drop(bucket, prefix=prefix)
+    try:
+        keys = [k async for k in async_redis_client.scan_iter(match=f"{_redis_key(bucket, prefix)}*", count=500)]
+        for i in range(0, len(keys), 500):
+            await async_redis_client.delete(*keys[i:i + 500])
+    except RedisError as e:
+        logger.warning(f"Signed URL cache invalidation failed for {prefix}: {e}")
@@ -0,0 +1,157 @@
+# app/services/status_events.py
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from redis.exceptions import RedisError
+from app.services.redis_service import redis_client, async_redis_client
+
+logger = logging.getLogger("status_events")
+
+# Workers publish every image status change on imgstatus:{shop}; each API process holds
+# one pattern subscription and fans events out to that shop's open streams
+STATUS_CHANNEL_PREFIX = "imgstatus:"
+STATUS_EVENTS_ENABLED = os.getenv("STATUS_EVENTS_ENABLED", "true").lower() == "true"
+# Events buffered per open stream; a client that falls this far behind is dropped and resyncs
+STATUS_STREAM_BUFFER = int(os.getenv("STATUS_STREAM_BUFFER", "256"))
+STATUS_SUBSCRIBE_TIMEOUT = float(os.getenv("STATUS_SUBSCRIBE_TIMEOUT", "5"))
+
+
+def status_channel(shop: str) -> str:
+    return f"{STATUS_CHANNEL_PREFIX}{shop}"
+
+
+def status_event(image_id: str, shop: str, status: str, **fields) -> str:
+    event = {"id": image_id, "status": status, "at": time.time()}
+    event.update({k: v for k, v in fields.items() if v is not None})
+    return json.dumps(event, separators=(",", ":"))
+
+
+def publish_status(image_id: str, shop: str, status: str, **fields):
+    """Announce a status change to the shop's live streams. Best effort: the row is the source of truth."""
+    if not STATUS_EVENTS_ENABLED or not shop:
+        return
+    try:
+        redis_client.publish(status_channel(shop), status_event(image_id, shop, status, **fields))
+    except RedisError as e:
+        logger.warning(f"Status event for {image_id} not published: {e}")
+
+
+def publish_statuses(events: list[dict]):
+    """Batch form of publish_status (dicts with image_id, shop, status and extra fields): one round trip."""
+    if not STATUS_EVENTS_ENABLED or not events:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for event in events:
+            fields = dict(event)
+            image_id, shop, status = fields.pop("image_id"), fields.pop("shop"), fields.pop("status")
+            pipe.publish(status_channel(shop), status_event(image_id, shop, status, **fields))
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"{len(events)} status event(s) not published: {e}")
+
+
+class StatusStream:
+    """One client's view of a shop's events. `overflowed` means events were lost and it must resync."""
+
+    def __init__(self, shop: str):
+        self.shop = shop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STATUS_STREAM_BUFFER)
+        self.overflowed = False
+
+    def push(self, data: Optional[str]):
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def next(self, timeout: float) -> Optional[str]:
+        """Next event, or None on timeout or once the hub has stopped."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class StatusHub:
+    """
+    Per-process fan-out of worker status events: a single Redis connection no matter how
+    many dashboards are open, instead of one subscription per client.
+    """
+
+    def __init__(self):
+        self._streams: dict[str, set[StatusStream]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    async def subscribe(self, shop: str) -> StatusStream:
+        """
+        Register a stream; events published after this returns are delivered to it.
+        Raises TimeoutError when Redis cannot be subscribed to in time.
+        """
+        if self._task is None or self._task.done():
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._listen())
+        await asyncio.wait_for(self._ready.wait(), STATUS_SUBSCRIBE_TIMEOUT)
+        stream = StatusStream(shop)
+        self._streams.setdefault(shop, set()).add(stream)
+        return stream
+
+    def unsubscribe(self, stream: StatusStream):
+        streams = self._streams.get(stream.shop)
+        if streams:
+            streams.discard(stream)
+            if not streams:
+                del self._streams[stream.shop]
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def _dispatch(self, channel: str, data: Optional[str]):
+        for stream in list(self._streams.get(channel[len(STATUS_CHANNEL_PREFIX):], ())):
+            stream.push(data)
+
+    def _drop_all(self):
+        # Events may have been missed while disconnected: end every stream so clients resync
+        for streams in self._streams.values():
+            for stream in streams:
+                stream.overflowed = True
+                stream.push(None)
+
+    async def _listen(self):
+        while True:
+            pubsub = async_redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{STATUS_CHANNEL_PREFIX}*")
+                self._ready.set()
+                logger.info("📡 Listening for image status events")
+                while True:
+                    message = await pubsub.get_message(timeout=30)
+                    if message and message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                self._drop_all()
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Status event subscription lost, reconnecting: {e}")
+                self._ready.clear()
+                self._drop_all()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+status_hub = StatusHub()
@@ -0,0 +1,52 @@
+# app/services/status_poller.py
+import os
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from app.services.makeit3d_client import AsyncMakeIt3DClient
+
+logger = logging.getLogger("status_poller")
+
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "50"))
+POLL_APPLY_CONCURRENCY = int(os.getenv("POLL_APPLY_CONCURRENCY", "16"))
+
+# apply_result(job, status_data, error) — exactly one of status_data / error is set
+ApplyResult = Callable[[dict, Optional[dict], Optional[Exception]], None]
+
+
+class StatusPoller:
+    """
+    Fans out MakeIt3D status checks over one keep-alive connection pool.
+    Each result is applied in a worker thread as soon as it arrives, so slow
+    DB/storage work for one task never holds up the others.
+    """
+
+    def __init__(self):
+        self.client: Optional[AsyncMakeIt3DClient] = None
+        self._fetch_slots = asyncio.Semaphore(POLL_CONCURRENCY)
+        self._apply_slots = asyncio.Semaphore(POLL_APPLY_CONCURRENCY)
+
+    async def __aenter__(self):
+        self.client = AsyncMakeIt3DClient(max_connections=POLL_CONCURRENCY)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def _check_one(self, job: dict, apply_result: ApplyResult):
+        status_data, error = None, None
+        async with self._fetch_slots:
+            try:
+                status_data = await self.client.get_task_status(job["task_id"])
+            except Exception as e:
+                error = e
+
+        async with self._apply_slots:
+            try:
+                await asyncio.to_thread(apply_result, job, status_data, error)
+            except Exception as e:
+                logger.error(f"❌ Failed to apply poll result for {job.get('image_id')}: {e}")
+
+    async def check_all(self, jobs: list[dict], apply_result: ApplyResult):
+        await asyncio.gather(*(self._check_one(job, apply_result) for job in jobs))
@@ -0,0 +1,213 @@
+# app/services/storage_stream.py
+import os
+import time
+import base64
+import hashlib
+import logging
+import threading
+from typing import BinaryIO, Iterable, Optional
+
+import requests
+
+logger = logging.getLogger("storage_stream")
+
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+TUS_ENDPOINT = f"{SUPABASE_URL}/storage/v1/upload/resumable"
+# Supabase resumable uploads require every chunk except the last to be exactly 6MB
+TUS_CHUNK_SIZE = 6 * 1024 * 1024
+TUS_PATCH_RETRIES = 3
+DOWNLOAD_READ_SIZE = 64 * 1024
+FILE_READ_SIZE = 1024 * 1024
+TRANSFER_TIMEOUT = (10, 60)  # connect, read
+
+# requests.Session is not guaranteed thread-safe; poll results are applied from a thread pool
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _auth_headers() -> dict:
+    return {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Tus-Resumable": "1.0.0",
+    }
+
+
+def _b64(value: str) -> str:
+    return base64.b64encode(value.encode("utf-8")).decode()
+
+
+def _create_upload(bucket: str, path: str, content_type: str, total_length: Optional[int], upsert: bool) -> str:
+    headers = _auth_headers()
+    headers["Upload-Metadata"] = ",".join([
+        f"bucketName {_b64(bucket)}",
+        f"objectName {_b64(path)}",
+        f"contentType {_b64(content_type)}",
+        f"cacheControl {_b64('3600')}",
+    ])
+    headers["x-upsert"] = "true" if upsert else "false"
+    if total_length is None:
+        headers["Upload-Defer-Length"] = "1"
+    else:
+        headers["Upload-Length"] = str(total_length)
+
+    res = _session().post(TUS_ENDPOINT, headers=headers, timeout=TRANSFER_TIMEOUT)
+    if res.status_code != 201 or "Location" not in res.headers:
+        raise Exception(f"Resumable upload create failed: HTTP {res.status_code} {res.text}")
+    return res.headers["Location"]
+
+
+def _server_offset(location: str) -> int:
+    res = _session().head(location, headers=_auth_headers(), timeout=TRANSFER_TIMEOUT)
+    res.raise_for_status()
+    return int(res.headers["Upload-Offset"])
+
+
+def _patch_chunk(location: str, offset: int, chunk: bytes, final_length: Optional[int]) -> int:
+    """Send one chunk, resuming from the server's offset if the connection drops mid-way."""
+    start = offset
+    for attempt in range(TUS_PATCH_RETRIES + 1):
+        headers = _auth_headers()
+        headers["Upload-Offset"] = str(offset)
+        headers["Content-Type"] = "application/offset+octet-stream"
+        if final_length is not None:
+            headers["Upload-Length"] = str(final_length)
+        try:
+            res = _session().patch(location, data=chunk[offset - start:], headers=headers, timeout=TRANSFER_TIMEOUT)
+            if res.status_code == 204:
+                return int(res.headers["Upload-Offset"])
+            raise Exception(f"HTTP {res.status_code} {res.text}")
+        except Exception as e:
+            if attempt == TUS_PATCH_RETRIES:
+                raise Exception(f"Resumable upload chunk failed at offset {offset}: {e}")
+            logger.warning(f"🔁 Chunk upload interrupted at offset {offset} ({e}), resuming...")
+            offset = _server_offset(location)
+            if not start <= offset <= start + len(chunk):
+                raise Exception(f"Resumable upload offset {offset} outside current chunk")
+
+
+def upload_stream(
+    chunks: Iterable[bytes],
+    bucket: str,
+    path: str,
+    content_type: str,
+    total_length: Optional[int] = None,
+    upsert: bool = False,
+) -> dict:
+    """
+    Stream chunks into storage with a TUS resumable upload. At most one
+    TUS_CHUNK_SIZE buffer is held at a time, whatever the object size.
+    Returns transfer stats: bytes, seconds and bytes_per_sec.
+    """
+    started = time.monotonic()
+    location = _create_upload(bucket, path, content_type, total_length, upsert)
+
+    buffer = bytearray()
+    offset = 0
+    for piece in chunks:
+        buffer += piece
+        # Strictly greater: the final chunk is always sent below, carrying the deferred length
+        while len(buffer) > TUS_CHUNK_SIZE:
+            chunk = bytes(buffer[:TUS_CHUNK_SIZE])
+            del buffer[:TUS_CHUNK_SIZE]
+            offset = _patch_chunk(location, offset, chunk, None)
+
+    # Last (possibly short) chunk declares the final length when it was deferred
+    final_length = offset + len(buffer)
+    if buffer or offset == 0:
+        offset = _patch_chunk(location, offset, bytes(buffer), final_length if total_length is None else None)
+
+    if total_length is not None and offset != total_length:
+        raise Exception(f"Resumable upload incomplete: {offset}/{total_length} bytes")
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    return {"bytes": offset, "seconds": round(elapsed, 3), "bytes_per_sec": int(offset / elapsed)}
+
+
+def stream_file_to_storage(
+    fileobj: BinaryIO,
+    bucket: str,
+    path: str,
+    content_type: str,
+    total_length: Optional[int] = None,
+) -> tuple[str, dict]:
+    """
+    Upload a file object chunk by chunk (e.g. a spooled multipart upload), hashing it on
+    the way. Returns (sha256 hex, transfer stats) without ever holding the whole file.
+    """
+    digest = hashlib.sha256()
+
+    def chunks():
+        while True:
+            piece = fileobj.read(FILE_READ_SIZE)
+            if not piece:
+                return
+            digest.update(piece)
+            yield piece
+
+    stats = upload_stream(chunks(), bucket, path, content_type, total_length=total_length)
+    return digest.hexdigest(), stats
+
+
+def read_object_head(bucket: str, path: str, length: int) -> Optional[tuple[bytes, int]]:
+    """
+    First `length` bytes and total size of a stored object, in one ranged GET.
+    None when the object does not exist (e.g. a direct upload that never happened).
+    """
+    headers = _auth_headers()
+    headers.pop("Tus-Resumable")
+    headers["Range"] = f"bytes=0-{length - 1}"
+    res = _session().get(
+        f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path}",
+        headers=headers,
+        timeout=TRANSFER_TIMEOUT,
+    )
+    # Storage answers a missing object with 400 "not_found" as well as 404
+    if res.status_code in (400, 404):
+        return None
+    res.raise_for_status()
+
+    content_range = res.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        size = int(content_range.rsplit("/", 1)[1])
+    else:
+        # Object shorter than the range, or server ignored it: the body is the whole object
+        size = len(res.content)
+    return res.content[:length], size
+
+
+def download_bytes(url: str) -> bytes:
+    """Fetch a remote asset into memory, for results that must be re-encoded before storing."""
+    res = _session().get(url, timeout=TRANSFER_TIMEOUT)
+    res.raise_for_status()
+    return res.content
+
+
+def stream_url_to_storage(url: str, bucket: str, path: str, content_type: str, upsert: bool = False) -> dict:
+    """Pipe a remote asset straight into storage without holding it in memory."""
+    with _session().get(url, stream=True, timeout=TRANSFER_TIMEOUT) as res:
+        res.raise_for_status()
+        length = res.headers.get("Content-Length")
+        total_length = int(length) if length and "Content-Encoding" not in res.headers else None
+
+        stats = upload_stream(
+            res.iter_content(chunk_size=DOWNLOAD_READ_SIZE),
+            bucket,
+            path,
+            content_type,
+            total_length=total_length,
+            upsert=upsert,
+        )
+
+    logger.info(
+        f"📦 Streamed {stats['bytes']} bytes to {path} in {stats['seconds']}s "
+        f"({stats['bytes_per_sec'] / 1024 / 1024:.2f} MB/s)"
+    )
+    return stats
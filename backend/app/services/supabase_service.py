@@ -77,15 +77,35 @@ def deduct_shop_credit(shop_domain: str, amount: int = 1, image_id: str = None):
     return new_balance
 
 
+def deduct_shop_credits_atomic(shop_domain: str, amount: int, reason: str = "Image processing") -> int:
+    """
+    Take `amount` credits in one conditional UPDATE (deduct_shop_credits RPC), so
+    concurrent uploads can never overdraw. Raises ValueError when credits are short.
+    """
+    res = supabase.rpc("deduct_shop_credits", {
+        "p_shop": shop_domain,
+        "p_amount": amount,
+        "p_reason": reason,
+    }).execute()
+    if res.data is None:
+        raise ValueError("Not enough credits")
+    return res.data
+
+
 def add_shop_credits(shop_domain: str, amount: int, reason: str = "Admin top-up"):
-    current = get_shop_credits(shop_domain)
-    new_balance = current + amount
-    supabase.table("shop_credits").update({
-        "credits": new_balance,
-        "updated_at": datetime.utcnow().isoformat()
-    }).eq("shop_domain", shop_domain).execute()
-    log_credit_transaction(shop_domain, amount, reason)
-    return new_balance
+    """
+    Give back or top up `amount` credits in one UPDATE (add_shop_credits RPC), so a
+    refund cannot overwrite a deduction made at the same time. Raises ValueError when
+    the shop has no credits row.
+    """
+    res = supabase.rpc("add_shop_credits", {
+        "p_shop": shop_domain,
+        "p_amount": amount,
+        "p_reason": reason,
+    }).execute()
+    if res.data is None:
+        raise ValueError("Shop credits not found")
+    return res.data
 
 
 def log_credit_transaction(shop_domain: str, change_amount: int, reason: str):
@@ -1,23 +1,75 @@
 # image_tasks.py
 import os
+import asyncio
 import time
-import requests
+import random
 import uuid
 from pathlib import Path
+from typing import Optional
 from app.services.supabase_service import supabase
 from app.logging_config import logger
-from app.services.signed_url_util import get_signed_url
+from app.services.signed_url_util import get_signed_url, invalidate_signed_urls
 from celery import shared_task
 from app.services.supabase_service import add_shop_credits
+from app.services.poll_scheduler import (
+    schedule_poll,
+    claim_due_polls,
+    complete_poll,
+    is_poll_scheduled,
+    get_poll_job,
+    claim_task_completion,
+    release_task_completion,
+    next_poll_delay,
+    backoff_delay,
+    request_poll_wakeup,
+    clear_poll_wakeup,
+    POLL_MAX_ATTEMPTS,
+    POLL_QUEUE,
+)
+from app.services.redis_lease import RedisLease
+from app.services.status_poller import StatusPoller
+from app.services.storage_stream import stream_url_to_storage, download_bytes
+from app.services.makeit3d_client import makeit3d_client, CircuitOpenError, MakeIt3DError, SUBMIT_DEADLINE
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter
+from app.services import result_cache
+from app.services import download_cache
+from app.services.derivatives import make_derivatives, derivative_path, DERIVATIVE_CONTENT_TYPE
+from app.services.local_engine import LOCAL_ENGINE_OPERATIONS, run_local, run_in_pool, encode_output, output_type
+from app.services.shop_settings import get_output_encoding, output_variant
+from app.services.status_events import publish_status, publish_statuses
+from app.config.operations import OPERATIONS
+from app.services.fair_queue import (
+    enqueue_job,
+    enqueue_jobs,
+    take_fair_batch,
+    finish_job,
+    can_dispatch,
+    request_dispatch_wakeup,
+    clear_dispatch_wakeup,
+    DISPATCH_QUEUE,
+)
 
-MAKEIT3D_API_KEY = os.getenv("MAKEIT3D_API_KEY")
-MAKEIT3D_BASE_URL = "https://api.makeit3d.io"
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "makeit3d-public")
+POLL_BATCH_SIZE = int(os.getenv("POLL_BATCH_SIZE", "200"))
+POLL_LEASE_TTL_MS = int(os.getenv("POLL_LEASE_TTL_MS", "60000"))
+# Renewed well inside the TTL, so a single slow renewal does not lose it
+POLL_LEASE_RENEW_INTERVAL = POLL_LEASE_TTL_MS / 1000 / 3
+# When set, MakeIt3D pushes completions here and polling becomes a slow safety net
+MAKEIT3D_CALLBACK_URL = os.getenv("MAKEIT3D_CALLBACK_URL")
+CALLBACK_SAFETY_POLL_DELAY = float(os.getenv("CALLBACK_SAFETY_POLL_DELAY", "60"))
+SUBMIT_SLOT_RETRY_MAX_DELAY = float(os.getenv("SUBMIT_SLOT_RETRY_MAX_DELAY", "5"))
+DISPATCH_LEASE_TTL_MS = int(os.getenv("DISPATCH_LEASE_TTL_MS", "30000"))
 
-HEADERS = {
-    "X-API-Key": MAKEIT3D_API_KEY,
-    "Content-Type": "application/json",
-}
+# Shared across all workers; a slot outlives a crashed worker by at most the submit deadline
+submission_limiter = AdaptiveConcurrencyLimiter("makeit3d-submit", slot_ttl=SUBMIT_DEADLINE + 60)
+
+
+class SubmitSlotUnavailable(Exception):
+    """The shared AIMD window is full; the caller should try the submission again shortly."""
+
+
+def submit_slot_retry_delay() -> float:
+    return random.uniform(1, SUBMIT_SLOT_RETRY_MAX_DELAY)
 
 
 def wait_for_signed_url(path: str, retries: int = 10, delay: int = 5) -> str:
@@ -30,9 +82,92 @@ def wait_for_signed_url(path: str, retries: int = 10, delay: int = 5) -> str:
     raise FileNotFoundError(f"File not found or timed out waiting: {path}")
 
 
-@shared_task(queue="image_queue")
-def submit_job_task(image_id: str, operation: str, image_path: str, shop: str):
-    logger.info(f"🚀 Starting job for image_id: {image_id}, operation: {operation}")
+@shared_task(bind=True, queue="image_queue")
+def submit_job_task(
+    self,
+    image_id: str,
+    operation: str,
+    image_path: str,
+    shop: str,
+    input_sha256: str = None,
+    pipeline: list[str] = None,
+):
+    stages = pipeline or [operation]
+
+    # ♻️ An identical job may have finished while this one waited in the queue
+    if input_sha256 and complete_from_cache(image_id, shop, input_sha256, result_cache.cache_operation(stages)):
+        finish_job(image_id)
+        wake_dispatcher()
+        return
+
+    # 🖥️ Deterministic operations never leave the worker
+    remote_stages, _ = split_stages(stages)
+    if not remote_stages:
+        try:
+            run_local_job(image_id, stages, image_path, shop)
+        finally:
+            finish_job(image_id)
+            wake_dispatcher()
+        return
+
+    waiting = False
+    try:
+        run_submission(image_id, stages, image_path, shop)
+    except SubmitSlotUnavailable:
+        # 🚦 The shared AIMD window is full: keep the dispatch spot and wait in the queue
+        waiting = True
+        raise self.retry(countdown=submit_slot_retry_delay(), max_retries=None)
+    finally:
+        if not waiting:
+            # Hand the freed spot in the dispatch window to the next shop in line
+            finish_job(image_id)
+            wake_dispatcher()
+
+
+def split_stages(stages: list[str]) -> tuple[list[str], list[str]]:
+    """
+    Split a job into the stages MakeIt3D must run and a trailing run the local engine
+    can finish in memory. A local-capable stage followed by a remote one goes to
+    MakeIt3D too, so an intermediate result never has to be uploaded for the provider.
+    """
+    cut = len(stages)
+    while cut > 0 and stages[cut - 1] in LOCAL_ENGINE_OPERATIONS:
+        cut -= 1
+    return stages[:cut], stages[cut:]
+
+
+def run_local_stages(stages: list[str], data: bytes) -> bytes:
+    for operation in stages:
+        data = run_local(operation, data, OPERATIONS[operation]["params"])
+    return data
+
+
+def run_local_job(image_id: str, stages: list[str], image_path: str, shop: str):
+    """Process the image with the local engine and store the result; no provider, no polling."""
+    logger.info(f"🖥️ Processing image_id: {image_id} locally, operation: {' → '.join(stages)}")
+    started = time.monotonic()
+    encoding, quality = get_output_encoding(shop)
+
+    try:
+        supabase.table("images").update({"status": "processing"}).eq("id", image_id).execute()
+        publish_status(image_id, shop, "processing")
+        original = supabase.storage.from_(SUPABASE_BUCKET).download(image_path)
+
+        output = run_local_stages(stages, original)
+        storage_path, row = save_output(image_id, shop, stages[-1], output, encoding, quality)
+    except Exception as e:
+        logger.error(f"❌ Local processing failed for image {image_id}: {e}")
+        fail_image(image_id, shop, "Image failed during processing.", "local processing error")
+        return
+
+    if row:
+        result_cache.store(row.get("input_sha256"), result_cache.cache_operation(stages), storage_path, output_variant(encoding, quality))
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    logger.info(f"✅ Image {image_id} processed locally in {elapsed_ms}ms ({len(original)} → {len(output)} bytes)")
+
+
+def run_submission(image_id: str, stages: list[str], image_path: str, shop: str):
+    logger.info(f"🚀 Starting job for image_id: {image_id}, operation: {' → '.join(stages)}")
 
     try:
         # Wait until the file is ready in Supabase
@@ -46,177 +181,652 @@ def submit_job_task(image_id: str, operation: str, image_path: str, shop: str):
 
         # ✅ Mark as processing
         supabase.table("images").update({"status": "processing"}).eq("id", image_id).execute()
+        publish_status(image_id, shop, "processing")
 
     except Exception as err:
         logger.error(f"❌ Pre-processing error: {err}")
-        supabase.table("images").update({"status": "error"}).eq("id", image_id).execute()
-        # Refund if needed
-        try:
-            if supabase.table("images").select("credits_deducted").eq("id", image_id).execute().data[0]["credits_deducted"]:
-                add_shop_credits(shop, amount=1)
-                supabase.table("images").update({"credits_deducted": False}).eq("id", image_id).execute()
-                logger.info(f"💸 Refunded 1 credit to {shop} due to pre-processing error")
-        except Exception:
-            pass
+        mark_error(image_id, shop)
+        refund_if_deducted(image_id, shop, "pre-processing error")
         return
 
-    # Map operation to MakeIt3D endpoint
-    endpoint_map = {
-        "remove-bg": "/generate/remove-background",
-        "upscale": "/generate/upscale",
-        "downscale": "/generate/downscale"
-    }
-    endpoint = endpoint_map.get(operation)
-    if not endpoint:
-        logger.error(f"❌ Invalid operation: {operation}")
-        supabase.table("images").update({"status": "error"}).eq("id", image_id).execute()
+    invalid = [op for op in stages if op not in OPERATIONS]
+    if invalid:
+        logger.error(f"❌ Invalid operation: {', '.join(invalid)}")
+        mark_error(image_id, shop)
+        return
+
+    try:
+        task_id = submit_stage(image_id, stages, 0, image_url)
+
+    except SubmitSlotUnavailable:
+        raise
+
+    except CircuitOpenError as e:
+        # Provider is down: fail fast and give the credit back instead of piling on
+        logger.error(f"⛔ MakeIt3D unavailable, not submitting image {image_id}: {e}")
+        mark_error(image_id, shop, "Processing provider unavailable, credit refunded. Please retry later.")
+        refund_if_deducted(image_id, shop, "provider unavailable")
         return
 
-    task_id = f"{operation}-{uuid.uuid4()}"
+    except Exception as e:
+        logger.error(f"❌ Failed to submit job for image {image_id}: {e}")
+        mark_error(image_id, shop)
+        refund_if_deducted(image_id, shop, "submission error")
+        return
+
+    # ⏰ Each task gets its own next-check time instead of a full-table sweep
+    schedule_stage_poll(task_id, image_id, shop, stages, 0)
+
+
+def submit_stage(image_id: str, stages: list[str], stage: int, input_url: str) -> str:
+    """
+    Submit one stage to MakeIt3D and record its task on the image. Returns the task id.
+    The AIMD slot is held for the provider call only; raises SubmitSlotUnavailable when
+    the window is full.
+    """
+    operation = stages[stage]
+    spec = OPERATIONS[operation]
     payload = {
-        "task_id": task_id,
-        "input_image_asset_url": image_url,
+        "task_id": f"{operation}-{uuid.uuid4()}",
+        "input_image_asset_url": input_url,
+        **spec["params"],
     }
+    if MAKEIT3D_CALLBACK_URL:
+        payload["webhook_url"] = MAKEIT3D_CALLBACK_URL
 
-    if operation in ["remove-bg", "upscale"]:
-        payload.update({"provider": "stability", "output_format": "png"})
-        if operation == "upscale":
-            payload.update({"model": "fast", "prompt": "high quality detailed image"})
-    elif operation == "downscale":
-        payload.update({"max_size_mb": 2.0, "aspect_ratio_mode": "original", "output_format": "jpeg"})
+    slot = submission_limiter.try_acquire()
+    if not slot:
+        raise SubmitSlotUnavailable()
 
+    started = time.monotonic()
     try:
-        res = requests.post(f"{MAKEIT3D_BASE_URL}{endpoint}", json=payload, headers=HEADERS)
-        res.raise_for_status()
-        api_response = res.json()
-        task_id = api_response.get("task_id")
-        if not task_id:
-            raise ValueError("No task_id returned from MakeIt3D API")
+        api_response = makeit3d_client.submit(spec["endpoint"], payload)
+    except CircuitOpenError:
+        # Not attempted, so it says nothing about the provider's load; the breaker handles it
+        raise
+    except MakeIt3DError as e:
+        submission_limiter.record_outcome(int((time.monotonic() - started) * 1000), error=e.overload)
+        raise
+    finally:
+        submission_limiter.release(slot)
+    submission_limiter.record_outcome(int((time.monotonic() - started) * 1000))
+
+    task_id = api_response.get("task_id")
+    if not task_id:
+        raise ValueError("No task_id returned from MakeIt3D API")
+
+    supabase.table("images").update({"task_id": task_id, "pipeline_stage": stage, "poll_attempts": 0}).eq("id", image_id).execute()
+    stage_note = f" (stage {stage + 1}/{len(stages)}: {operation})" if len(stages) > 1 else ""
+    logger.info(f"✅ Submitted to MakeIt3D: Image ID: {image_id}, Task ID: {task_id}{stage_note}")
+    return task_id
+
+
+def schedule_stage_poll(task_id: str, image_id: str, shop: str, stages: list[str], stage: int):
+    pipeline = stages if len(stages) > 1 else None
+    delay = schedule_poll(
+        task_id, image_id, shop,
+        delay=CALLBACK_SAFETY_POLL_DELAY if MAKEIT3D_CALLBACK_URL else None,
+        pipeline=pipeline,
+        stage=stage,
+    )
+    wake_poller(delay)
+
+
+def advance_pipeline(job: dict, asset_url: str):
+    """
+    Hand a finished intermediate stage to the next one. The provider's asset URL is
+    the next stage's input, or the bytes are pulled into memory when only local
+    stages remain; intermediates are never written to our bucket.
+    """
+    image_id, shop = job["image_id"], job["shop"]
+    stages, stage = job["pipeline"], job["stage"] + 1
+    remaining = stages[stage:]
+
+    remote_stages, _ = split_stages(remaining)
+    if not remote_stages:
+        encoding, quality = get_output_encoding(shop)
+        output = run_local_stages(remaining, download_bytes(asset_url))
+        storage_path, row = save_output(image_id, shop, stages[-1], output, encoding, quality)
+        if row:
+            result_cache.store(row.get("input_sha256"), result_cache.cache_operation(stages), storage_path, output_variant(encoding, quality))
+        logger.info(f"✅ Image {image_id} finished its last stage{'s' if len(remaining) > 1 else ''} locally.")
+        return
 
-        supabase.table("images").update({"task_id": task_id}).eq("id", image_id).execute()
-        logger.info(f"✅ Submitted to MakeIt3D: Image ID: {image_id}, Task ID: {task_id}")
+    task_id = submit_stage(image_id, stages, stage, asset_url)
+    schedule_stage_poll(task_id, image_id, shop, stages, stage)
+
+
+def queue_image_job(
+    image_id: str,
+    operation: str,
+    image_path: str,
+    shop: str,
+    input_sha256: str = None,
+    pipeline: list[str] = None,
+) -> int:
+    """Put a submission in its shop's fair queue. Returns how many jobs that shop has waiting."""
+    waiting = enqueue_job({
+        "image_id": image_id,
+        "operation": operation,
+        "image_path": image_path,
+        "shop": shop,
+        "input_sha256": input_sha256,
+        "pipeline": pipeline,
+    })
+    publish_status(image_id, shop, "queued", operation=operation, original_path=image_path)
+    wake_dispatcher()
+    return waiting
+
+
+def queue_image_jobs(jobs: list[dict]) -> list[int]:
+    """Batch form of queue_image_job: one Redis round trip and one dispatcher wake-up."""
+    positions = enqueue_jobs(jobs)
+    publish_statuses([{
+        "image_id": job["image_id"],
+        "shop": job["shop"],
+        "status": "queued",
+        "operation": job["operation"],
+        "original_path": job["image_path"],
+    } for job in jobs])
+    wake_dispatcher()
+    return positions
+
+
+def wake_dispatcher():
+    """Enqueue a dispatcher run unless one is already pending."""
+    if request_dispatch_wakeup():
+        dispatch_fair_queue.delay()
+
+
+def wake_poller(delay: float):
+    """Enqueue a poller run unless one is already due by then; duplicates cost nothing."""
+    if request_poll_wakeup(delay):
+        poll_due_images.apply_async(countdown=delay)
+
+
+def refund_if_deducted(image_id: str, shop: str, reason: str):
+    """Give back the credits for an image (one per stage) if charged and not refunded yet."""
+    try:
+        # Clear the flag first and only if it is still set, so two failures never refund twice
+        res = supabase.table("images").update({"credits_deducted": False}) \
+            .eq("id", image_id).eq("credits_deducted", True).execute()
+        if res.data:
+            amount = len(res.data[0].get("pipeline") or []) or 1
+            add_shop_credits(shop, amount, f"Refund: {reason}")
+            logger.info(f"💸 Refunded {amount} credit(s) to {shop} due to {reason}")
+    except Exception:
+        pass
+
+
+def fail_image(image_id: str, shop: str, error_message: str, reason: str):
+    supabase.table("images").update({
+        "status": "failed",
+        "error_message": error_message
+    }).eq("id", image_id).execute()
+    publish_status(image_id, shop, "failed", error_message=error_message)
+    refund_if_deducted(image_id, shop, reason)
+
+
+def mark_error(image_id: str, shop: str, error_message: str = None):
+    """The job never reached the provider; refunds are up to the caller."""
+    update = {"status": "error"}
+    if error_message:
+        update["error_message"] = error_message
+    supabase.table("images").update(update).eq("id", image_id).execute()
+    publish_status(image_id, shop, "error", error_message=error_message)
+
+
+def native_format(operation: str) -> str:
+    """Format the operation itself produces (MakeIt3D output_format)."""
+    return OPERATIONS.get(operation, {}).get("params", {}).get("output_format", "png")
+
+
+def store_processed_result(image_id: str, shop: str, asset_url: str):
+    """Store the finished asset in the shop's output encoding and mark the image processed."""
+    image = supabase.table("images").select("operation, pipeline").eq("id", image_id).single().execute().data
+    operation = image["operation"]
+    encoding, quality = get_output_encoding(shop)
+
+    if encoding == "original":
+        # Nothing to re-encode: stream straight through without holding the asset in memory
+        extension, content_type = output_type(native_format(operation))
+        storage_path = f"{shop}/processed/{uuid.uuid4()}{extension}"
+        stats = stream_url_to_storage(asset_url, SUPABASE_BUCKET, storage_path, content_type)
+        row = mark_processed(image_id, shop, storage_path)
+        attach_derivatives(image_id, storage_path)
+        logger.info(f"✅ Image {image_id} processed successfully ({stats['bytes_per_sec'] / 1024:.0f} KB/s).")
+    else:
+        storage_path, row = save_output(image_id, shop, operation, download_bytes(asset_url), encoding, quality)
+        logger.info(f"✅ Image {image_id} processed successfully.")
+
+    if row:
+        stages = image.get("pipeline") or [operation]
+        result_cache.store(row.get("input_sha256"), result_cache.cache_operation(stages), storage_path, output_variant(encoding, quality))
+
+
+def save_output(image_id: str, shop: str, operation: str, data: bytes, encoding: str, quality: int) -> tuple[str, Optional[dict]]:
+    """
+    Re-encode a result in the shop's output encoding, store it with the matching
+    extension and content type, and mark the image processed. The operation's own
+    output is kept whenever re-encoding would not make it smaller.
+    """
+    output, fmt = data, native_format(operation)
+    if encoding != "original":
+        encoded, used = run_in_pool(encode_output, data, encoding, quality)
+        if len(encoded) < len(data):
+            output, fmt = encoded, used
+
+    extension, content_type = output_type(fmt)
+    storage_path = f"{shop}/processed/{uuid.uuid4()}{extension}"
+    supabase.storage.from_(SUPABASE_BUCKET).upload(
+        path=storage_path,
+        file=output,
+        file_options={"content-type": content_type},
+    )
+
+    bytes_saved = len(data) - len(output)
+    row = mark_processed(image_id, shop, storage_path, bytes_saved=bytes_saved)
+    attach_derivatives(image_id, storage_path, output)
+    download_cache.prewarm(storage_path, output, content_type)
+    if bytes_saved:
+        logger.info(f"🗜️ Image {image_id} stored as {fmt}: {len(data)} → {len(output)} bytes ({bytes_saved / len(data):.0%} saved)")
+    return storage_path, row
+
+
+def mark_processed(image_id: str, shop: str, storage_path: str, bytes_saved: int = None) -> Optional[dict]:
+    """Point the image at its stored output and tell the shop's live streams; returns the updated row."""
+    update = {
+        "status": "processed",
+        "processed_path": storage_path,
+        "filename": Path(storage_path).name
+    }
+    if bytes_saved is not None:
+        update["bytes_saved"] = bytes_saved
+    res = supabase.table("images").update(update).eq("id", image_id).execute()
+    publish_status(image_id, shop, "processed", processed_path=storage_path)
+    return res.data[0] if res.data else None
 
+
+def attach_derivatives(image_id: str, processed_path: str, data: bytes = None):
+    """Store WebP preview/thumbnail next to the processed image. Best effort: lists fall back to the full image."""
+    try:
+        if data is None:
+            data = supabase.storage.from_(SUPABASE_BUCKET).download(processed_path)
+
+        update = {}
+        for name, encoded in make_derivatives(data).items():
+            path = derivative_path(processed_path, name)
+            supabase.storage.from_(SUPABASE_BUCKET).upload(
+                path=path,
+                file=encoded,
+                file_options={"content-type": DERIVATIVE_CONTENT_TYPE, "upsert": "true"},
+            )
+            update[f"{name}_path"] = path
+
+        supabase.table("images").update(update).eq("id", image_id).execute()
     except Exception as e:
-        logger.error(f"❌ Failed to submit job for image {image_id}: {e}")
-        supabase.table("images").update({"status": "error"}).eq("id", image_id).execute()
-        # Refund credit if deducted
-        try:
-            if supabase.table("images").select("credits_deducted").eq("id", image_id).execute().data[0]["credits_deducted"]:
-                add_shop_credits(shop, 1)
-                supabase.table("images").update({"credits_deducted": False}).eq("id", image_id).execute()
-                logger.info(f"💸 Refunded 1 credit to {shop} due to submission error")
-        except Exception:
-            pass
+        logger.warning(f"⚠️ Could not create derivatives for image {image_id}: {e}")
+
+
+def complete_from_cache(image_id: str, shop: str, input_sha256: str, operation: str) -> bool:
+    """
+    Finish the image from an earlier identical job's output, if there is one.
+    The output is copied into this shop's folder so it outlives the original.
+    """
+    variant = output_variant(*get_output_encoding(shop))
+    cached_path = result_cache.lookup(input_sha256, operation, variant)
+    if not cached_path:
+        return False
+
+    storage_path = f"{shop}/processed/{uuid.uuid4()}{Path(cached_path).suffix or '.png'}"
+    try:
+        supabase.storage.from_(SUPABASE_BUCKET).copy(cached_path, storage_path)
+    except Exception as e:
+        logger.warning(f"⚠️ Cached result {cached_path} unavailable, processing normally: {e}")
+        result_cache.invalidate(input_sha256, operation, variant)
+        invalidate_signed_urls([cached_path])
+        return False
 
-    poll_all_processing_images.apply_async(countdown=10)
+    mark_processed(image_id, shop, storage_path)
+    # May run inside an API request; leave the image work to a worker
+    generate_derivatives_task.delay(image_id, storage_path)
+    logger.info(f"♻️ Image {image_id} served from result cache ({cached_path})")
+    return True
 
 
-@shared_task(bind=True, max_retries=20, default_retry_delay=10)
-def poll_all_processing_images(self):
-    logger.info("🔄 Polling all images with status='processing'...")
+def apply_poll_result(job: dict, status_data: dict = None, error: Exception = None):
+    """Apply one MakeIt3D status check: finish the image or schedule its next check."""
+    image_id = job["image_id"]
 
     try:
-        response = supabase.table("images").select("*").eq("status", "processing").execute()
-        images = response.data or []
-
-        if not images:
-            logger.info("✅ No images left in processing.")
-            return "done"
-
-        for img in images:
-            task_id = img.get("task_id")
-            image_id = img.get("id")
-            shop = img.get("shop")
-            poll_attempts = img.get("poll_attempts", 0)
-
-            if poll_attempts >= 3:
-                logger.warning(f"⛔ Max retries exceeded for image {image_id}")
-                supabase.table("images").update({
-                    "status": "failed",
-                    "error_message": "Max polling attempts reached"
-                }).eq("id", image_id).execute()
-                # Refund credit if deducted
-                if img.get("credits_deducted"):
-                    try:
-                        add_shop_credits(shop, 1)
-                        supabase.table("images").update({"credits_deducted": False}).eq("id", image_id).execute()
-                        logger.info(f"💸 Refunded 1 credit to {shop} due to max retries")
-                    except Exception:
-                        pass
-                continue
-
-            try:
-                res = requests.get(f"{MAKEIT3D_BASE_URL}/tasks/{task_id}/status", headers=HEADERS)
-                res.raise_for_status()
-                status_data = res.json()
-
-                if status_data["status"] == "complete":
-                    asset_url = status_data.get("asset_url")
-                    if not asset_url:
-                        raise Exception("Missing asset_url in task result")
-
-                    image_res = requests.get(asset_url)
-                    image_res.raise_for_status()
-
-                    filename = f"{uuid.uuid4()}.png"
-                    storage_path = f"{shop}/processed/{filename}"
-
-                    upload_res = supabase.storage.from_(SUPABASE_BUCKET).upload(
-                        path=storage_path,
-                        file=image_res.content,
-                        file_options={"content-type": "image/png"},
-                    )
+        if isinstance(error, CircuitOpenError):
+            # Provider outage is not the task's fault; check again later without using up an attempt
+            reschedule_poll_job(job, count_attempt=False)
+            return
+        if error:
+            raise error
+        if not apply_terminal_status(job, status_data):
+            reschedule_poll_job(job)
+
+    except SubmitSlotUnavailable:
+        # The next stage could not get a submission slot; advance it on a later check
+        reschedule_poll_job(job, count_attempt=False)
+
+    except Exception as poll_error:
+        logger.error(f"❌ Poll error for {image_id}: {poll_error}")
+        reschedule_poll_job(job, error=str(poll_error))
+
+
+def apply_terminal_status(job: dict, status_data: dict) -> bool:
+    """
+    Finish the image if the task is complete or failed. Shared by the poller and the
+    completion callback; whichever sees the result first does the work.
+    Returns False while the task is still running.
+    """
+    task_id = job["task_id"]
+    image_id = job["image_id"]
+    shop = job["shop"]
+    status = status_data.get("status")
+
+    if status not in ("complete", "failed"):
+        return False
+
+    if not claim_task_completion(task_id):
+        logger.info(f"↩️ Task {task_id} already finalized, skipping.")
+        complete_poll(task_id)
+        return True
+
+    try:
+        if status == "complete":
+            asset_url = status_data.get("asset_url")
+            if not asset_url:
+                raise Exception("Missing asset_url in task result")
+            if job.get("pipeline") and job["stage"] + 1 < len(job["pipeline"]):
+                advance_pipeline(job, asset_url)
+            else:
+                store_processed_result(image_id, shop, asset_url)
+        else:
+            logger.warning(f"⚠️ Image {image_id} failed during processing.")
+            fail_image(image_id, shop, "Image failed during processing.", "processing failure")
+    except Exception:
+        release_task_completion(task_id)
+        raise
+
+    complete_poll(task_id)
+    return True
+
+
+def recheck_delay(attempt: int) -> float:
+    """Backoff for the next check; with callbacks on, polling stays a slow safety net on every attempt."""
+    delay = backoff_delay(attempt)
+    return max(delay, CALLBACK_SAFETY_POLL_DELAY) if MAKEIT3D_CALLBACK_URL else delay
+
+
+def reschedule_poll_job(job: dict, error: str = None, count_attempt: bool = True):
+    task_id = job["task_id"]
+    image_id = job["image_id"]
+    shop = job["shop"]
+    attempt = job["attempt"]
+
+    if not count_attempt:
+        delay = schedule_poll(task_id, image_id, shop, attempt=attempt, delay=recheck_delay(attempt), pipeline=job.get("pipeline"), stage=job.get("stage", 0))
+        logger.info(f"⏸️ Not counting this check, re-checking {image_id} in {delay:.0f}s")
+        return
+
+    attempt += 1
+
+    if attempt >= POLL_MAX_ATTEMPTS:
+        logger.warning(f"⛔ Max retries exceeded for image {image_id}")
+        fail_image(image_id, shop, "Max polling attempts reached", "max retries")
+        complete_poll(task_id)
+        return
+
+    update = {"poll_attempts": attempt}
+    if error:
+        update["error_message"] = error
+    supabase.table("images").update(update).eq("id", image_id).execute()
 
-                    if hasattr(upload_res, "error") and upload_res.error:
-                        raise Exception(f"Upload failed: {upload_res.error.message}")
-
-                    signed_url = get_signed_url(storage_path)
-
-                    supabase.table("images").update({
-                        "status": "processed",
-                        "processed_path": storage_path,
-                        "filename": Path(storage_path).name
-                    }).eq("id", image_id).execute()
-
-                    logger.info(f"✅ Image {image_id} processed successfully.")
-
-                elif status_data["status"] == "failed":
-                    logger.warning(f"⚠️ Image {image_id} failed during processing.")
-                    supabase.table("images").update({
-                        "status": "failed",
-                        "error_message": "Image failed during processing."
-                    }).eq("id", image_id).execute()
-                    # Refund credit if deducted
-                    if img.get("credits_deducted"):
-                        try:
-                            add_shop_credits(shop, 1)
-                            supabase.table("images").update({"credits_deducted": False}).eq("id", image_id).execute()
-                            logger.info(f"💸 Refunded 1 credit to {shop} due to processing failure")
-                        except Exception:
-                            pass
-
-                else:
-                    supabase.table("images").update({
-                        "poll_attempts": poll_attempts + 1
-                    }).eq("id", image_id).execute()
-                    logger.info(f"⏳ Still processing: {image_id} (Attempt {poll_attempts + 1}/3)")
-
-            except Exception as poll_error:
-                logger.error(f"❌ Poll error for {image_id}: {poll_error}")
-                supabase.table("images").update({
-                    "poll_attempts": poll_attempts + 1,
-                    "error_message": str(poll_error)
-                }).eq("id", image_id).execute()
-
-        # Retry if any still in processing
-        remaining = supabase.table("images").select("id").eq("status", "processing").execute()
-        if remaining.data:
-            logger.info("🔁 Still processing images found. Retrying in 10s...")
-            raise self.retry()
-
-        logger.info("✅ All processing complete.")
+    delay = schedule_poll(task_id, image_id, shop, attempt=attempt, delay=recheck_delay(attempt), pipeline=job.get("pipeline"), stage=job.get("stage", 0))
+    logger.info(f"⏳ Still processing: {image_id} (Attempt {attempt}/{POLL_MAX_ATTEMPTS}), next check in {delay:.0f}s")
+
+
+async def keep_lease(lease: RedisLease, lost: asyncio.Event):
+    """Renew the lease on an interval until cancelled; sets `lost` once a renewal fails."""
+    while True:
+        await asyncio.sleep(POLL_LEASE_RENEW_INTERVAL)
+        try:
+            # Directly on the loop: the executor threads may all be busy applying results
+            held = lease.heartbeat()
+        except Exception as e:
+            logger.warning(f"⚠️ Poller lease renewal failed: {e}")
+            held = False
+        if not held:
+            lost.set()
+            return
+
+
+async def drain_due_polls(lease: RedisLease) -> tuple[int, bool]:
+    """
+    Check due tasks batch by batch over one pooled client until none are due. The lease
+    is renewed in the background, since one batch can outlast its TTL; once it is lost,
+    no further batch is claimed.
+    """
+    checked = 0
+    lost = asyncio.Event()
+    renewer = asyncio.create_task(keep_lease(lease, lost))
+    try:
+        async with StatusPoller() as poller:
+            while True:
+                jobs = claim_due_polls(POLL_BATCH_SIZE)
+                await poller.check_all(jobs, apply_poll_result)
+                checked += len(jobs)
+                if lost.is_set():
+                    return checked, False
+                if len(jobs) < POLL_BATCH_SIZE:
+                    return checked, True
+    finally:
+        renewer.cancel()
+
+
+@shared_task(queue=POLL_QUEUE)
+def poll_due_images():
+    """Check only the tasks whose next-check time has passed, then re-arm for the next one."""
+    lease = RedisLease(f"poller:{POLL_QUEUE}", ttl_ms=POLL_LEASE_TTL_MS)
+    if not lease.acquire():
+        # The active poller re-arms itself when it finishes
+        logger.info("🔒 Poller already running, skipping duplicate wake-up.")
+        return "busy"
+
+    clear_poll_wakeup()
+    try:
+        checked, lease_held = asyncio.run(drain_due_polls(lease))
+    finally:
+        lease.release()
+
+    delay = next_poll_delay()
+    if not lease_held:
+        # Whoever took over may already be done, so re-arm anyway: wake-ups are coalesced
+        logger.warning("⚠️ Poller lease lost, handing over.")
+        if delay is not None:
+            wake_poller(max(1, delay))
+        return "lease-lost"
+
+    if delay is None:
+        logger.info(f"✅ Checked {checked} task(s), nothing left in processing.")
         return "done"
 
+    wake_poller(max(1, delay))
+    logger.info(f"🔁 Checked {checked} task(s), next check in {delay:.0f}s")
+    return "scheduled"
+
+
+@shared_task(queue="image_queue")
+def generate_derivatives_task(image_id: str, processed_path: str):
+    attach_derivatives(image_id, processed_path)
+
+
+@shared_task(queue="image_queue")
+def backfill_derivatives(limit: int = 500):
+    """Create thumbnails/previews for processed images finished before derivatives existed."""
+    response = supabase.table("images") \
+        .select("id, processed_path") \
+        .eq("status", "processed") \
+        .is_("thumbnail_path", "null") \
+        .limit(limit) \
+        .execute()
+
+    rows = [img for img in response.data or [] if img.get("processed_path")]
+    for img in rows:
+        attach_derivatives(img["id"], img["processed_path"])
+    logger.info(f"🖼️ Backfilled derivatives for {len(rows)} image(s)")
+    return len(rows)
+
+
+@shared_task(queue=POLL_QUEUE)
+def release_upload_reservations(image_ids: list[str], shop: str):
+    """
+    Refund direct uploads that were reserved by /upload/init but never finalized.
+    Only rows still awaiting upload are touched, so a late or repeated run is harmless.
+    """
+    res = supabase.table("images") \
+        .update({
+            "status": "failed",
+            "error_message": "Upload was never finalized",
+            "credits_deducted": False,
+        }) \
+        .in_("id", image_ids) \
+        .eq("status", "awaiting_upload") \
+        .execute()
+
+    expired = res.data or []
+    if not expired:
+        return 0
+    amount = sum(len(row.get("pipeline") or []) or 1 for row in expired)
+    add_shop_credits(shop, amount, "Refund: upload not finalized")
+    publish_statuses([
+        {"image_id": row["id"], "shop": shop, "status": "failed", "error_message": "Upload was never finalized"}
+        for row in expired
+    ])
+    try:
+        supabase.storage.from_(SUPABASE_BUCKET).remove([row["original_path"] for row in expired])
+        invalidate_signed_urls(row["original_path"] for row in expired)
     except Exception as e:
-        logger.error(f"❌ Unexpected polling error: {e}")
+        logger.warning(f"Could not remove expired direct uploads: {e}")
+    logger.info(f"💸 Released {len(expired)} unfinalized upload(s), refunded {amount} credit(s) to {shop}")
+    return len(expired)
+
+
+@shared_task(queue=POLL_QUEUE)
+def reconcile_status_counts(shop: str = None):
+    """Repair drift in image_status_counts (all shops, or one) from the images table."""
+    res = supabase.rpc("reconcile_image_status_counts", {"p_shop": shop}).execute()
+    fixed = res.data or 0
+    if fixed:
+        logger.warning(f"🧮 Repaired {fixed} drifted status counter(s){f' for {shop}' if shop else ''}")
+    else:
+        logger.info(f"🧮 Status counters in sync{f' for {shop}' if shop else ''}")
+    return fixed
+
+
+@shared_task(queue=DISPATCH_QUEUE)
+def dispatch_fair_queue():
+    """
+    Move jobs from the per-shop queues into image_queue with deficit round-robin,
+    keeping at most FAIR_DISPATCH_WINDOW in flight so one shop's batch cannot
+    bury everyone else's uploads.
+    """
+    lease = RedisLease("fair-dispatcher", ttl_ms=DISPATCH_LEASE_TTL_MS)
+    if not lease.acquire():
+        # The active dispatcher re-checks for work after releasing
+        return "busy"
+
+    clear_dispatch_wakeup()
+    dispatched = 0
+    try:
+        while True:
+            jobs = take_fair_batch()
+            if not jobs:
+                break
+            for i, job in enumerate(jobs):
+                try:
+                    submit_job_task.delay(
+                        job["image_id"], job["operation"], job["image_path"], job["shop"],
+                        job.get("input_sha256"), job.get("pipeline"),
+                    )
+                except Exception as e:
+                    logger.error(f"❌ Dispatch failed, returning {len(jobs) - i} job(s) to their queues: {e}")
+                    for pending in reversed(jobs[i:]):
+                        finish_job(pending["image_id"])
+                        enqueue_job(pending, front=True)
+                    raise
+                dispatched += 1
+            if not lease.heartbeat():
+                break
+    finally:
+        lease.release()
+        # Work that arrived while the lease was held found it busy; pick it up now
+        clear_dispatch_wakeup()
+        if can_dispatch():
+            wake_dispatcher()
+
+    if dispatched:
+        logger.info(f"📤 Dispatched {dispatched} job(s) to image_queue")
+    return dispatched
+
+
+@shared_task(bind=True, queue=POLL_QUEUE, max_retries=3, default_retry_delay=10)
+def handle_task_callback(self, status_data: dict):
+    """Finish an image as soon as MakeIt3D reports its task complete or failed."""
+    task_id = status_data.get("task_id")
+    job = get_poll_job(task_id)
+    if not job:
+        # Not in the schedule (already finalized or lost); fall back to the DB row
+        res = supabase.table("images").select("id, shop, status, pipeline, pipeline_stage").eq("task_id", task_id).execute()
+        if not res.data or res.data[0]["status"] != "processing":
+            logger.info(f"↩️ Ignoring callback for unknown or finished task {task_id}")
+            return "ignored"
+        img = res.data[0]
+        job = {"task_id": task_id, "image_id": img["id"], "shop": img["shop"], "attempt": 0}
+        if img.get("pipeline"):
+            job.update({"pipeline": img["pipeline"], "stage": img.get("pipeline_stage") or 0})
+
+    try:
+        if not apply_terminal_status(job, status_data):
+            return "pending"
+    except SubmitSlotUnavailable:
+        # Next stage is waiting for a submission slot; does not use up a retry
+        raise self.retry(countdown=submit_slot_retry_delay(), max_retries=None)
+    except Exception as e:
+        logger.error(f"❌ Callback handling failed for task {task_id}: {e}")
         raise self.retry(exc=e)
+
+    logger.info(f"📬 Callback finalized task {task_id} ({status_data.get('status')})")
+    return "done"
+
+
+@shared_task(queue=POLL_QUEUE)
+def reschedule_orphaned_polls():
+    """Re-register processing images whose poll entry was lost (e.g. Redis flush or upgrade)."""
+    response = supabase.table("images") \
+        .select("id, shop, task_id, poll_attempts, pipeline, pipeline_stage") \
+        .eq("status", "processing") \
+        .execute()
+
+    restored = 0
+    for img in response.data or []:
+        task_id = img.get("task_id")
+        if not task_id or is_poll_scheduled(task_id):
+            continue
+        schedule_poll(
+            task_id, img["id"], img["shop"],
+            attempt=img.get("poll_attempts") or 0,
+            delay=0,
+            pipeline=img.get("pipeline"),
+            stage=img.get("pipeline_stage") or 0,
+        )
+        restored += 1
+
+    if restored:
+        wake_poller(0)
+    logger.info(f"🩹 Re-scheduled {restored} orphaned poll job(s)")
+    return restored
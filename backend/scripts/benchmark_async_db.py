@@ -0,0 +1,122 @@
+"""
+Event-loop blocking benchmark: sync vs async Supabase client inside async handlers.
+
+Starts a local stand-in for PostgREST that answers most queries in --fast-ms and a
+fraction (--slow-ratio) in --slow-ms, then sends --requests handler coroutines at a
+fixed --rate to one event loop, the way requests reach a uvicorn worker:
+
+    python scripts/benchmark_async_db.py --requests 2000 --rate 200
+
+"sync" calls supabase_service-style blocking queries from `async def` handlers (the old
+routers); "async" awaits app.services.async_supabase. With the sync client every slow
+query stalls every other request on the loop, which shows up in the fast requests' p99.
+Latency is measured from each request's scheduled arrival, so time spent waiting for a
+blocked loop counts.
+
+Run from the backend directory so `app` is importable.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_KEY = "bench.bench.bench"
+
+
+def start_fake_postgrest(fast_ms: float, slow_ms: float) -> str:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep((slow_ms if "slow" in self.path else fast_ms) / 1000)
+            body = json.dumps([{"id": "bench", "status": "processed"}]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def summarize(label: str, timings: list[float]):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{label:<14} n={len(timings):<5} "
+        f"median={statistics.median(timings) * 1000:8.1f}ms  p99={p99 * 1000:8.1f}ms  max={timings[-1] * 1000:8.1f}ms"
+    )
+
+
+async def run_load(handler, requests: int, rate: float, slow_ratio: float):
+    """Open-loop load: request i arrives at i / rate whether or not earlier ones finished."""
+    fast, slow = [], []
+    started = time.perf_counter()
+
+    async def one(i: int, is_slow: bool):
+        arrival = started + i / rate
+        await asyncio.sleep(max(0, arrival - time.perf_counter()))
+        await handler("slow" if is_slow else "fast")
+        (slow if is_slow else fast).append(time.perf_counter() - arrival)
+
+    await asyncio.gather(*(one(i, random.random() < slow_ratio) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return fast, slow, elapsed
+
+
+async def bench(url: str, args):
+    os.environ["SUPABASE_URL"] = url
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = FAKE_KEY
+
+    from supabase import create_client
+    from app.services import async_supabase
+
+    async_supabase.SUPABASE_URL = url
+    async_supabase.SUPABASE_SERVICE_ROLE_KEY = FAKE_KEY
+
+    sync_client = create_client(url, FAKE_KEY)
+    db = await async_supabase.get_db()
+
+    async def sync_handler(kind: str):
+        # What the routers did: a blocking query straight from an async def
+        sync_client.table("images").select("*").eq("id", kind).execute()
+
+    async def async_handler(kind: str):
+        await db.table("images").select("*").eq("id", kind).execute()
+
+    for label, handler in (("sync client", sync_handler), ("async client", async_handler)):
+        fast, slow, elapsed = await run_load(handler, args.requests, args.rate, args.slow_ratio)
+        print(f"\n{label}: {args.requests} requests in {elapsed:.2f}s ({args.requests / elapsed:.0f} req/s)")
+        summarize("  fast queries", fast)
+        if slow:
+            summarize("  slow queries", slow)
+        summarize("  all", fast + slow)
+
+    await async_supabase.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p99 of async handlers using the sync vs async Supabase client")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="requests per second")
+    parser.add_argument("--fast-ms", type=float, default=5)
+    parser.add_argument("--slow-ms", type=float, default=300)
+    parser.add_argument("--slow-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    url = start_fake_postgrest(args.fast_ms, args.slow_ms)
+    print(f"fake PostgREST at {url}: {args.fast_ms}ms fast, {args.slow_ms}ms for {args.slow_ratio:.0%} of queries")
+    asyncio.run(bench(url, args))
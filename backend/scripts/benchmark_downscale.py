@@ -0,0 +1,104 @@
+"""
+Benchmark the local downscale engine against the MakeIt3D /generate/downscale path.
+
+Local only (synthetic 4000x3000 photo-like image, or --image):
+
+    python scripts/benchmark_downscale.py --runs 20
+
+Include the remote path (submit + poll until complete) for a public image URL:
+
+    MAKEIT3D_API_KEY=... python scripts/benchmark_downscale.py \
+        --image product.png --remote-url https://example.com/product.png --remote-runs 3
+
+Run from the backend directory so `app` is importable.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageFilter
+
+from app.config.operations import OPERATIONS
+from app.services.local_engine import LOCAL_HANDLERS, run_local
+
+PARAMS = OPERATIONS["downscale"]["params"]
+
+
+def synthetic_image(width: int = 4000, height: int = 3000) -> bytes:
+    """Noisy gradient: compresses like a photo, so the size limit actually bites."""
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    img = Image.blend(noise, gradient, 0.5).filter(ImageFilter.SMOOTH)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def summarize(label: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{label:<22} runs={len(timings):<3} "
+        f"median={statistics.median(timings) * 1000:8.1f}ms  p95={p95 * 1000:8.1f}ms  max={timings[-1] * 1000:8.1f}ms"
+    )
+
+
+def bench_local(data: bytes, runs: int):
+    inline, pooled = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = LOCAL_HANDLERS["downscale"](data, **PARAMS)
+        inline.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        run_local("downscale", data, PARAMS)
+        pooled.append(time.perf_counter() - started)
+
+    print(f"input {len(data) / 1024 / 1024:.2f} MB → output {len(output) / 1024 / 1024:.2f} MB")
+    summarize("local (inline)", inline)
+    summarize("local (process pool)", pooled)
+
+
+def bench_remote(url: str, runs: int, poll_interval: float):
+    from app.services.makeit3d_client import makeit3d_client
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        payload = {"task_id": f"downscale-{uuid.uuid4()}", "input_image_asset_url": url, **PARAMS}
+        task_id = makeit3d_client.submit(OPERATIONS["downscale"]["endpoint"], payload)["task_id"]
+        while True:
+            status = makeit3d_client.get_task_status(task_id).get("status")
+            if status in ("complete", "failed"):
+                break
+            time.sleep(poll_interval)
+        timings.append(time.perf_counter() - started)
+        if status == "failed":
+            print(f"⚠️ remote task {task_id} failed")
+    summarize("remote (submit+poll)", timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local vs MakeIt3D downscale latency")
+    parser.add_argument("--image", help="input image file (default: synthetic 12MP image)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--remote-url", help="public URL of the same image, enables the remote benchmark")
+    parser.add_argument("--remote-runs", type=int, default=3)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_image()
+
+    bench_local(data, args.runs)
+    if args.remote_url:
+        bench_remote(args.remote_url, args.remote_runs, args.poll_interval)
@@ -0,0 +1,53 @@
+"""
+Local stand-in for MakeIt3D completion callbacks.
+
+Signs a task status payload the same way /webhooks/makeit3d verifies it and
+posts it to a running backend, so the push path can be exercised without the
+real provider:
+
+    MAKEIT3D_WEBHOOK_SECRET=dev-secret python scripts/fake_makeit3d_callback.py \
+        --task-id upscale-1234 --asset-url https://example.com/result.png
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import requests
+
+
+def send_callback(backend_url: str, secret: str, task_id: str, status: str, asset_url: str = None):
+    body = json.dumps({"task_id": task_id, "status": status, "asset_url": asset_url}).encode("utf-8")
+    timestamp = str(int(time.time()))
+    signature = hmac.new(secret.encode("utf-8"), timestamp.encode("utf-8") + b"." + body, hashlib.sha256).hexdigest()
+
+    return requests.post(
+        f"{backend_url.rstrip('/')}/webhooks/makeit3d",
+        data=body,
+        headers={
+            "Content-Type": "application/json",
+            "X-MakeIt3D-Timestamp": timestamp,
+            "X-MakeIt3D-Signature": f"sha256={signature}",
+        },
+        timeout=10,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fire a signed MakeIt3D task callback at the backend")
+    parser.add_argument("--backend-url", default=os.getenv("BACKEND_URL", "http://localhost:8000"))
+    parser.add_argument("--secret", default=os.getenv("MAKEIT3D_WEBHOOK_SECRET"))
+    parser.add_argument("--task-id", required=True)
+    parser.add_argument("--status", default="complete", choices=["complete", "failed"])
+    parser.add_argument("--asset-url")
+    parser.add_argument("--repeat", type=int, default=1, help="send the same callback N times to exercise dedupe")
+    args = parser.parse_args()
+
+    if not args.secret:
+        raise SystemExit("❌ Set MAKEIT3D_WEBHOOK_SECRET or pass --secret")
+
+    for _ in range(args.repeat):
+        res = send_callback(args.backend_url, args.secret, args.task_id, args.status, args.asset_url)
+        print(f"{res.status_code} {res.text}")
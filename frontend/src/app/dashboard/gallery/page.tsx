@@ -1,7 +1,7 @@
 'use client';
 
-import { useEffect, useState } from 'react';
-import useSWR from 'swr';
+import { useEffect } from 'react';
+import useSWRInfinite from 'swr/infinite';
 import useShop from '@/hooks/useShop';
 import Image from 'next/image';
 import Link from 'next/link';
@@ -12,61 +12,37 @@ interface ImageItem {
   id: string;
   original_path: string;
   processed_path?: string;
+  display_url?: string | null;
   status: 'pending' | 'processing' | 'processed' | 'completed' | 'failed' | 'queued';
   error_message?: string;
   filename: string;
 }
 
+interface ImagesPage {
+  images: ImageItem[];
+  next_cursor: string | null;
+}
+
+const PAGE_SIZE = 48;
+
 const fetcher = (url: string) =>
   fetch(url, { credentials: 'include' }).then((res) => res.json());
 
 export default function GalleryPage() {
   const { shop, loading: shopLoading } = useShop();
   const supabase = getSupabase();
-  const { data, error, isLoading, mutate } = useSWR(
-    shop ? `${process.env.NEXT_PUBLIC_BACKEND_URL}/images` : null,
+  // Keyset pages of processed images; unchanged pages revalidate as 304s
+  const getKey = (index: number, previous: ImagesPage | null) => {
+    if (!shop || (previous && !previous.next_cursor)) return null;
+    const cursor = previous?.next_cursor ? `&cursor=${encodeURIComponent(previous.next_cursor)}` : '';
+    return `${process.env.NEXT_PUBLIC_BACKEND_URL}/images?status=processed&limit=${PAGE_SIZE}${cursor}`;
+  };
+  const { data, error, isLoading, mutate, size, setSize, isValidating } = useSWRInfinite<ImagesPage>(
+    getKey,
     fetcher,
     { refreshInterval: 5000 }
   );
 
-  const [signedUrls, setSignedUrls] = useState<Record<string, string>>({});
-
-  // fetch signed URLs for processed images
-  useEffect(() => {
-    const fetchSignedUrls = async () => {
-      if (!data?.images) return;
-
-      const paths = data.images
-        .filter((img: ImageItem) => img.processed_path && !signedUrls[img.processed_path])
-        .map((img: ImageItem) => img.processed_path!);
-
-      const updates: Record<string, string> = {};
-
-      await Promise.all(
-        paths.map(async (path: string) => {
-          try {
-            const res = await fetch(
-              `${process.env.NEXT_PUBLIC_BACKEND_URL}/fileserve/signed-url/${encodeURIComponent(path)}`,
-              { credentials: 'include' }
-            );
-            const json = await res.json();
-            if (res.ok && json.signed_url) {
-              updates[path] = json.signed_url;
-            }
-          } catch (err) {
-            console.warn(`Failed to fetch signed URL for ${path}`);
-          }
-        })
-      );
-
-      if (Object.keys(updates).length > 0) {
-        setSignedUrls((prev) => ({ ...prev, ...updates }));
-      }
-    };
-
-    fetchSignedUrls();
-  }, [data?.images, signedUrls]);
-
   // subscribe to real-time updates from Supabase
   useEffect(() => {
     if (!shop) return;
@@ -109,8 +85,8 @@ export default function GalleryPage() {
     return <div className="p-6 text-center text-red-500">Error loading images.</div>;
   }
 
-  const images: ImageItem[] = data?.images || [];
-  const processedImages = images.filter((img) => img.status === 'processed');
+  const processedImages: ImageItem[] = data?.flatMap((page) => page.images || []) ?? [];
+  const hasMore = Boolean(data?.[data.length - 1]?.next_cursor);
 
   return (
     <div className="px-4 sm:px-6 pt-10 pb-16 max-w-7xl mx-auto text-gray-900 dark:text-white">
@@ -133,7 +109,8 @@ export default function GalleryPage() {
         <div className="mt-6 max-h-[600px] overflow-y-auto pr-2">
           <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 gap-6">
             {processedImages.map((img) => {
-              const previewUrl = img.processed_path ? signedUrls[img.processed_path] : '';
+              // Thumbnail signed by the backend; the full image is only fetched on download
+              const previewUrl = img.display_url || '';
 
               return (
                 <Link key={img.id} href={previewUrl || '#'} target="_blank">
@@ -170,6 +147,17 @@ export default function GalleryPage() {
               );
             })}
           </div>
+          {hasMore && (
+            <div className="flex justify-center mt-6">
+              <button
+                onClick={() => setSize(size + 1)}
+                disabled={isValidating}
+                className="text-blue-500 hover:underline font-medium disabled:opacity-50"
+              >
+                {isValidating ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
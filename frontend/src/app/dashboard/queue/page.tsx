@@ -3,7 +3,6 @@
 import useShop from '@/hooks/useShop';
 import { useEffect, useState } from 'react';
 import { Badge, EmptyState, Thumbnail, BlockStack, Text } from '@shopify/polaris';
-import { getSupabase } from '../../../../utils/supabase/supabaseClient'; 
 
 interface ImageRecord {
   id: string;
@@ -24,57 +23,34 @@ export default function QueuePage() {
   useEffect(() => {
     if (!shop) return;
 
-    const supabase = getSupabase(); // ✅ reuse shared instance
-    let interval: NodeJS.Timeout;
-    let channel: ReturnType<typeof supabase.channel>;
-
-    const fetchImages = async () => {
-      try {
-        const res = await fetch(`${process.env.NEXT_PUBLIC_BACKEND_URL}/images`, {
-          credentials: 'include',
-        });
-        const data = await res.json();
-        setImages(data.images || []);
-      } catch (err) {
-        console.error('❌ Error fetching images:', err);
-      } finally {
-        setLoading(false);
-      }
-    };
-
-    fetchImages();
-    interval = setInterval(fetchImages, 10000); // poll every 10s
-
-    channel = supabase
-      .channel(`realtime:images-${shop}`)
-      .on(
-        'postgres_changes',
-        {
-          event: '*',
-          schema: 'public',
-          table: 'images',
-          filter: `shop=eq.${shop}`,
-        },
-        (payload) => {
-          const newRecord = payload.new as ImageRecord;
-          const eventType = payload.eventType;
-
-          setImages((prev) => {
-            if (eventType === 'INSERT') return [newRecord, ...prev];
-            if (eventType === 'UPDATE')
-              return prev.map((img) => (img.id === newRecord.id ? newRecord : img));
-            if (eventType === 'DELETE')
-              return prev.filter((img) => img.id !== (payload.old as ImageRecord).id);
-            return prev;
-          });
+    // Snapshot on every (re)connect, then one event per status change pushed by the workers
+    const source = new EventSource(`${process.env.NEXT_PUBLIC_BACKEND_URL}/images/events`, {
+      withCredentials: true,
+    });
+
+    source.addEventListener('snapshot', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setImages(data.images || []);
+      setLoading(false);
+    });
+
+    source.addEventListener('status', (e) => {
+      const update = JSON.parse((e as MessageEvent).data) as Partial<ImageRecord> & { id: string };
+      setImages((prev) => {
+        const known = prev.some((img) => img.id === update.id);
+        if (!known) {
+          return [{ filename: '', original_path: '', processed_path: null, ...update } as ImageRecord, ...prev];
         }
-      )
-      .subscribe();
+        return prev.map((img) => (img.id === update.id ? { ...img, ...update } : img));
+      });
+    });
 
-    return () => {
-      clearInterval(interval);
-      supabase.removeChannel(channel);
+    source.onerror = () => {
+      // EventSource reconnects by itself and the next snapshot resyncs the list
+      setLoading(false);
     };
+
+    return () => source.close();
   }, [shop]);
 
   const getStatusBadge = (status: string) => {
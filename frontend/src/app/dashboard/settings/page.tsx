@@ -4,6 +4,7 @@ import React, { useEffect, useRef, useState } from 'react';
 import {
   Text,
   Checkbox,
+  Select,
   Banner,
   Spinner,
   Toast,
@@ -18,6 +19,7 @@ export default function SettingsPage() {
   const { shop, loading: shopLoading } = useShop();
   const [backgroundRemoval, setBackgroundRemoval] = useState(true);
   const [optimizeImages, setOptimizeImages] = useState(true);
+  const [outputEncoding, setOutputEncoding] = useState('original');
   const [avatarUrl, setAvatarUrl] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const [saving, setSaving] = useState(false);
@@ -41,6 +43,7 @@ export default function SettingsPage() {
         if (data) {
           setBackgroundRemoval(data.background_removal);
           setOptimizeImages(data.optimize_images);
+          setOutputEncoding(data.output_encoding ?? 'original');
           setAvatarUrl(data.avatar_path);
         }
       } catch (err: any) {
@@ -63,6 +66,7 @@ export default function SettingsPage() {
         body: JSON.stringify({
           background_removal: backgroundRemoval,
           optimize_images: optimizeImages,
+          output_encoding: outputEncoding,
           avatar_path: avatarUrl,
         }),
       });
@@ -127,6 +131,19 @@ export default function SettingsPage() {
                 checked={optimizeImages}
                 onChange={() => setOptimizeImages((prev) => !prev)}
               />
+              {optimizeImages && (
+                <Select
+                  label="Output format"
+                  options={[
+                    { label: 'Keep original format', value: 'original' },
+                    { label: 'WebP (smallest, widely supported)', value: 'webp' },
+                    { label: 'AVIF (smallest, newer browsers)', value: 'avif' },
+                    { label: 'Optimized PNG (keeps transparency)', value: 'png' },
+                  ]}
+                  value={outputEncoding}
+                  onChange={setOutputEncoding}
+                />
+              )}
             </BlockStack>
 
             <Divider />